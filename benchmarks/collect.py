@@ -0,0 +1,262 @@
+"""Run the collector against a local stand-in for HDX and time it.
+
+    python -m benchmarks.collect                    # 40 countries
+    python -m benchmarks.collect --countries 100 --latency 0.1
+
+The stand-in is an `http.server` that serves dataset pages and CSVs the way
+HDX does: ETag and Last-Modified, 304 on a matching If-None-Match, 206 for a
+Range request (unless If-Range names another version) and 416 for a range
+that starts at the end of the file. Before timing, the script checks the
+collector's paths on it: a first download cut off mid-file and resumed, a
+second run answered with 304s, a complete `.part` finished by a 416, an
+absolute download link and a changed `--base-url` both sent to the
+stand-in, and a resource link that has gone scraped again.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.collect import Collector, save_manifest
+
+# where the stand-in's pages point their absolute download links
+REAL_HOST = "https://data.humdata.org"
+
+
+class StandIn:
+    """HDX dataset pages and CSVs served from memory on a local port."""
+
+    def __init__(self, latency=0.0):
+        self.files = {}  # download path -> bytes
+        self.links = {}  # dataset page path -> download href
+        self.truncate = set()  # download paths cut off on their next GET
+        self.requests = []  # (method, path, status, request headers)
+        self.latency = latency
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add(self, iso3, size, absolute=False):
+        path = f"/download/{iso3.lower()}_food_prices.csv"
+        self.files[path] = os.urandom(size)
+        href = REAL_HOST + path if absolute else path
+        self.links[f"/dataset/wfp-food-prices-for-{iso3.lower()}"] = href
+        return REAL_HOST + f"/dataset/wfp-food-prices-for-{iso3.lower()}"
+
+    def statuses(self, prefix="/download/"):
+        return [
+            status for _, path, status, _ in self.requests if path.startswith(prefix)
+        ]
+
+    @staticmethod
+    def etag(body):
+        return '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=b"", headers=()):
+                stand_in.requests.append(
+                    ("GET", self.path, status, dict(self.headers.items()))
+                )
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                if status != 304:
+                    self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                time.sleep(stand_in.latency)
+                if self.path in stand_in.links:
+                    href = stand_in.links[self.path]
+                    page = f'<a class="btn resource-download-button" href="{href}">Download</a>'
+                    return self._send(200, page.encode())
+                body = stand_in.files.get(self.path)
+                if body is None:
+                    return self._send(404)
+
+                etag = stand_in.etag(body)
+                validators = [
+                    ("ETag", etag),
+                    ("Last-Modified", "Mon, 06 Jan 2025 00:00:00 GMT"),
+                ]
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, headers=validators)
+
+                byte_range = self.headers.get("Range")
+                if_range = self.headers.get("If-Range")
+                if byte_range and (if_range is None or if_range == etag):
+                    start = int(byte_range.removeprefix("bytes=").rstrip("-"))
+                    if start >= len(body):
+                        headers = [("Content-Range", f"bytes */{len(body)}")]
+                        return self._send(416, headers=headers)
+                    headers = validators + [
+                        ("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+                    ]
+                    return self._send(206, body[start:], headers)
+
+                if self.path in stand_in.truncate:
+                    # promise the whole file, send half of it and hang up
+                    stand_in.truncate.discard(self.path)
+                    stand_in.requests.append(("GET", self.path, 200, {}))
+                    self.send_response(200)
+                    for name, value in validators:
+                        self.send_header(name, value)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body[: len(body) // 2])
+                    self.close_connection = True
+                    return
+                return self._send(200, body, validators)
+
+        return Handler
+
+
+def collect(stand_in, output_dir, countries, base_url=None, concurrency=8):
+    collector = Collector(
+        output_dir,
+        concurrency=concurrency,
+        retries=2,
+        backoff=0.01,
+        timeout=10,
+        base_url=base_url or stand_in.url,
+    )
+    return collector, asyncio.run(collector.run(countries))
+
+
+def check():
+    stand_in = StandIn()
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            countries = [
+                ("AFG", stand_in.add("AFG", 300_000)),
+                ("MLI", stand_in.add("MLI", 50_000, absolute=True)),
+                ("YEM", stand_in.add("YEM", 200_000)),
+            ]
+            yemen = "/download/yem_food_prices.csv"
+
+            # first run: Yemen is cut off halfway and resumed with a Range
+            # request; Mali's absolute link goes to the stand-in, not HDX
+            stand_in.truncate.add(yemen)
+            collector, results = collect(stand_in, output_dir, countries)
+            assert set(results.values()) == {"downloaded"}, results
+            yemen_requests = [r for r in stand_in.requests if r[1] == yemen]
+            assert [r[2] for r in yemen_requests] == [200, 206], yemen_requests
+            assert yemen_requests[1][3]["Range"].startswith("bytes=")
+            for iso3, entry in collector.manifest.items():
+                with open(os.path.join(output_dir, entry["file"]), "rb") as f:
+                    body = f.read()
+                assert body == stand_in.files["/download/" + entry["file"]], iso3
+                assert entry["url"].startswith(REAL_HOST), entry["url"]
+
+            # second run: every file is unchanged and costs one 304
+            stand_in.requests.clear()
+            collector, results = collect(stand_in, output_dir, countries)
+            assert set(results.values()) == {"unchanged"}, results
+            assert stand_in.statuses("/") == [304] * 3, stand_in.requests
+
+            # a run interrupted after the last byte: the .part is complete,
+            # the Range starts at its end and the 416 finishes it
+            entry = collector.manifest["AFG"]
+            path = os.path.join(output_dir, entry["file"])
+            os.replace(path, f"{path}.part")
+            body = stand_in.files["/download/" + entry["file"]]
+            collector.manifest["AFG"] = {
+                "url": entry["url"],
+                "file": entry["file"],
+                "part_etag": StandIn.etag(body),
+            }
+            save_manifest(output_dir, collector.manifest)
+            stand_in.requests.clear()
+            collector, results = collect(stand_in, output_dir, countries[:1])
+            assert results == {"AFG": "downloaded"}, results
+            assert stand_in.statuses() == [416], stand_in.requests
+            assert not os.path.exists(f"{path}.part")
+            assert (
+                collector.manifest["AFG"]["sha256"] == hashlib.sha256(body).hexdigest()
+            )
+
+            # a manifest written against one stand-in is rebased onto another
+            other = StandIn()
+            try:
+                other.files, other.links = stand_in.files, stand_in.links
+                stand_in.requests.clear()
+                collector, results = collect(
+                    stand_in, output_dir, countries, base_url=other.url
+                )
+                assert set(results.values()) == {"unchanged"}, results
+                assert not stand_in.requests and other.statuses() == [304] * 3
+            finally:
+                other.close()
+
+            # Mali's resource moved: the stored link answers 404 and the
+            # dataset page is scraped again
+            old = "/download/mli_food_prices.csv"
+            new = "/download/mli_food_prices_2025.csv"
+            stand_in.files[new] = stand_in.files.pop(old) + b"new month\n"
+            stand_in.links["/dataset/wfp-food-prices-for-mli"] = REAL_HOST + new
+            stand_in.requests.clear()
+            collector, results = collect(stand_in, output_dir, countries[1:2])
+            assert results == {"MLI": "downloaded"}, results
+            assert stand_in.statuses() == [404, 200], stand_in.requests
+            assert collector.manifest["MLI"]["url"] == REAL_HOST + new
+    finally:
+        stand_in.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--countries", type=int, default=40)
+    parser.add_argument("--size", type=int, default=500_000, help="bytes per CSV")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="seconds the stand-in waits per request",
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 16])
+    args = parser.parse_args(argv)
+
+    check()
+    print("stand-in checks passed")
+
+    stand_in = StandIn(latency=args.latency)
+    try:
+        countries = [
+            (f"C{i:02d}", stand_in.add(f"C{i:02d}", args.size))
+            for i in range(args.countries)
+        ]
+        print(f"{'concurrency':>11} {'first run s':>12} {'304 run s':>10}")
+        for concurrency in args.concurrency:
+            with tempfile.TemporaryDirectory() as output_dir:
+                start = time.perf_counter()
+                collect(stand_in, output_dir, countries, concurrency=concurrency)
+                first = time.perf_counter() - start
+                start = time.perf_counter()
+                collect(stand_in, output_dir, countries, concurrency=concurrency)
+                again = time.perf_counter() - start
+            print(f"{concurrency:>11} {first:>12.2f} {again:>10.2f}")
+    finally:
+        stand_in.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
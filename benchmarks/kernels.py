@@ -0,0 +1,141 @@
+"""Time the grouped-reduction kernels against the pandas groupby they replace.
+
+    python -m benchmarks.kernels                    # 300k, 3M and 30M rows
+    python -m benchmarks.kernels --rows 3000000 --repeats 5
+
+Two aggregations, both on the same synthetic WFP frame: building the price
+cube (monthly sum and count per country) and the bar chart's top 20
+commodities by mean price over every country-year slice. The script checks
+that both implementations agree before timing them.
+"""
+
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from src.backend import PandasBackend
+from src.data import (
+    ESSENTIAL_COMMODITIES,
+    SliceIndex,
+    build_price_cube,
+    compact_wfp,
+)
+
+from .synthetic import make_wfp
+
+
+def pandas_price_cube(wfp, essential_commodities):
+    """The groupby implementation of `build_price_cube`."""
+    groups = {
+        "All Commodities": wfp,
+        "Essential Commodities": wfp[wfp["commodity"].isin(essential_commodities)],
+    }
+    price_cube = {}
+    for group, df in groups.items():
+        prices = df["standardprice"].astype("float64")
+        monthly = (
+            prices.groupby([df["country"], df["date"]], observed=True)
+            .agg(["sum", "count"])
+            .reset_index()
+        )
+        monthly["year"] = monthly["date"].dt.year.astype("int16")
+        for country, frame in monthly.groupby("country", observed=True, sort=False):
+            price_cube[(group, country)] = frame[
+                ["date", "year", "sum", "count"]
+            ].reset_index(drop=True)
+    return price_cube
+
+
+def pandas_top_commodities(df_slice, n=20):
+    """The groupby and full sort behind the bar chart before the kernels."""
+    df_bar = (
+        df_slice.groupby(["category", "commodity", "Unit"], observed=True)[
+            "standardprice"
+        ]
+        .mean()
+        .reset_index()
+        .sort_values("standardprice", ascending=False)
+        .head(n)
+    )
+    df_bar[["category", "commodity", "Unit"]] = df_bar[
+        ["category", "commodity", "Unit"]
+    ].astype(str)
+    df_bar["standardprice"] = df_bar["standardprice"].astype("float64").round(3)
+    return df_bar.reset_index(drop=True)
+
+
+def check(wfp_index, backend):
+    expected = pandas_price_cube(wfp_index.frame, ESSENTIAL_COMMODITIES)
+    actual = build_price_cube(wfp_index.frame, ESSENTIAL_COMMODITIES)
+    if expected.keys() != actual.keys():
+        raise AssertionError("price cube keys differ")
+    for key, frame in expected.items():
+        pd.testing.assert_frame_equal(actual[key], frame, rtol=1e-12)
+
+    for country, year in wfp_index.year_ranges:
+        expected = pandas_top_commodities(wfp_index.get(country, year))
+        actual = backend.top_commodities(country, year)
+        # the kernels average in float64, pandas in the float32 of the column
+        same = expected.drop(columns="standardprice").equals(
+            actual.drop(columns="standardprice")
+        ) and np.allclose(expected["standardprice"], actual["standardprice"], atol=1e-3)
+        if not same:
+            raise AssertionError(f"top commodities differ for {country} {year}")
+
+
+def best_of(func, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[300_000, 3_000_000, 30_000_000]
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'rows':>12} {'case':<16} {'pandas ms':>10} {'kernels ms':>11} {'speedup':>8}"
+    )
+    for n_rows in args.rows:
+        wfp, _ = compact_wfp(make_wfp(n_rows))
+        wfp_index = SliceIndex(wfp)
+        backend = PandasBackend(wfp_index, None, None)
+        check(wfp_index, backend)
+
+        slices = list(wfp_index.year_ranges)
+        cases = [
+            (
+                "price cube",
+                lambda: pandas_price_cube(wfp_index.frame, ESSENTIAL_COMMODITIES),
+                lambda: build_price_cube(wfp_index.frame, ESSENTIAL_COMMODITIES),
+                1,
+            ),
+            (
+                "top commodities",
+                lambda: [pandas_top_commodities(wfp_index.get(*key)) for key in slices],
+                lambda: [backend.top_commodities(*key) for key in slices],
+                len(slices),  # reported per slice
+            ),
+        ]
+        for name, old, new, per in cases:
+            old_ms = best_of(old, args.repeats) * 1000 / per
+            new_ms = best_of(new, args.repeats) * 1000 / per
+            print(
+                f"{n_rows:>12,} {name:<16} {old_ms:>10.2f} {new_ms:>11.2f} "
+                f"{old_ms / new_ms:>7.1f}x"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
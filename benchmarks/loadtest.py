@@ -0,0 +1,325 @@
+"""Drive /_dash-update-component with simulated users and report per-callback load.
+
+    python -m src.app                                   # or gunicorn src.app:server
+    python -m benchmarks.loadtest --users 1 4 16 64     # ramp concurrency
+    python -m benchmarks.loadtest --duration 60 --output load.json
+
+Every simulated user loops over the interactions a person makes on the
+dashboard and sends the same callback requests the browser would:
+
+- country:  pick a country on the Country tab (year options, then the map and
+            the box/bar plots for its first year)
+- region:   click a region on the map (box/bar plots for that region)
+- slider:   drag the year range slider on the Global tab (price and
+            undernourishment charts at every step)
+- multi:    add countries to the Global tab selection one at a time
+
+Each concurrency level runs for `--duration` seconds and reports throughput,
+p50/p95/p99 latency and the error rate for every callback.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+SCENARIOS = ["country", "region", "slider", "multi"]
+
+
+class DashClient:
+    """Builds callback requests from the app's own dependency list."""
+
+    def __init__(self, url, timeout=30):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.dependencies = {
+            dep["output"]: dep
+            for dep in self._get("/_dash-dependencies")
+            if not dep.get("clientside_function")
+        }
+        self.layout = self._get("/_dash-layout")
+        # tabs other than the first are built when first selected; open them
+        # as the browser would, so their components can be looked up
+        rendered = self.props("rendered-tabs")["data"]
+        for tab in self.props("tabs")["children"]:
+            tab_id = tab["props"]["tab_id"]
+            if tab_id not in rendered:
+                self.layout = [self.layout, self.open_tab(tab_id, rendered)]
+                rendered = rendered + [tab_id]
+
+    def _get(self, path):
+        with urllib.request.urlopen(self.url + path, timeout=self.timeout) as r:
+            return json.load(r)
+
+    def output_key(self, component_id):
+        """Dependency key of the server callback whose first output is `component_id`."""
+        for key in self.dependencies:
+            if key.strip(".").startswith(f"{component_id}."):
+                return key
+        raise KeyError(f"no server callback outputs {component_id!r}")
+
+    def open_tab(self, tab_id, rendered):
+        """Content of a tab that has not been rendered yet."""
+        output = f"{tab_id}-tab-content.children"
+        key = next(key for key in self.dependencies if output in key)
+        values = {"tabs": tab_id, "rendered-tabs": rendered}
+        status, _, response = self.update(key, values, [("tabs", "active_tab")])
+        if status != 200:
+            raise RuntimeError(f"rendering tab {tab_id!r} failed with {status}")
+        return response["response"][f"{tab_id}-tab-content"]["children"]
+
+    def props(self, component_id):
+        """Props of a component in the initial layout."""
+        stack = [self.layout]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(node)
+            elif isinstance(node, dict):
+                props = node.get("props", {})
+                if props.get("id") == component_id:
+                    return props
+                stack.extend(props.values())
+        raise KeyError(f"no component {component_id!r} in the layout")
+
+    def options(self, component_id):
+        """Option values of a dropdown in the initial layout."""
+        return [
+            o["value"] if isinstance(o, dict) else o
+            for o in self.props(component_id).get("options", [])
+        ]
+
+    def body(self, key, values, changed):
+        dep = self.dependencies[key]
+        if key.startswith(".."):
+            outputs = [
+                dict(zip(("id", "property"), o.rsplit(".", 1)))
+                for o in key.strip(".").split("...")
+            ]
+        else:
+            outputs = dict(zip(("id", "property"), key.rsplit(".", 1)))
+        inputs = [
+            {"id": i["id"], "property": i["property"], "value": values.get(i["id"])}
+            for i in dep["inputs"]
+        ]
+        state = [
+            {"id": s["id"], "property": s["property"], "value": values.get(s["id"])}
+            for s in dep["state"]
+        ]
+        return {
+            "output": key,
+            "outputs": outputs,
+            "inputs": inputs,
+            "state": state,
+            "changedPropIds": [f"{c}.{p}" for c, p in changed],
+        }
+
+    def update(self, key, values, changed):
+        """POST one callback; returns (status, seconds, response JSON or None)."""
+        data = json.dumps(self.body(key, values, changed)).encode()
+        request = urllib.request.Request(
+            self.url + "/_dash-update-component",
+            data=data,
+            headers={"Content-Type": "application/json"},
+        )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as r:
+                payload = r.read()
+                status = r.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            # Dash answers PreventUpdate with 204, which urllib treats as success
+            return e.code, time.perf_counter() - start, None
+        except (urllib.error.URLError, OSError):
+            return 0, time.perf_counter() - start, None
+        elapsed = time.perf_counter() - start
+        return status, elapsed, json.loads(payload) if payload else None
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, callback, status, seconds):
+        with self._lock:
+            self.samples.setdefault(callback, []).append((status, seconds))
+
+
+class User:
+    """One simulated browser session with its own selections."""
+
+    def __init__(self, client, recorder, rng):
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+        self.countries = client.options("country")
+        self.global_countries = client.options("country-dropdown")
+        slider = client.props("year-slider")
+        self.years = list(range(slider["min"], slider["max"] + 1))
+        self.values = {
+            "country": self.rng.choice(self.countries),
+            "year": None,
+            "country-year": client.props("country-year")["data"],
+            "map-graph": None,
+            "country-dropdown": [self.rng.choice(self.global_countries)],
+            "year-slider": [self.years[0], self.years[-1]],
+            "commodity-dropdown": "All Commodities",
+        }
+        self.regions = []
+
+    def _call(self, component_id, changed):
+        key = self.client.output_key(component_id)
+        # every callback input is the single tracked prop of its component
+        status, seconds, response = self.client.update(key, self.values, changed)
+        self.recorder.add(component_id, status, seconds)
+        if status != 200:
+            return None
+        # keep what the charts' Stores hold, so later updates can be patches
+        for output_id, props in response["response"].items():
+            if "data" in props:
+                self.values[output_id] = props["data"]
+        return response
+
+    def country(self):
+        self.values["country"] = self.rng.choice(self.countries)
+        self.values["map-graph"] = None
+        # also writes the "country-year" Store the figures below read
+        response = self._call("year", [("country", "value")])
+        if response:
+            self.values["year"] = response["response"]["year"]["value"]
+        changed = [("country-year", "data")]
+        figure = self._call("map-graph", changed)
+        self._call("boxplot-frame", changed)
+        self.regions = []
+        if figure:
+            # a full figure: the country changed
+            for trace in figure["response"]["map-graph"]["figure"].get("data", []):
+                for point in trace.get("customdata") or []:
+                    if point:
+                        self.regions.append(point[0])
+
+    def region(self):
+        if self.values["year"] is None or not self.regions:
+            return self.country()
+        region = self.rng.choice(self.regions)
+        self.values["map-graph"] = {"points": [{"customdata": [region]}]}
+        self._call("boxplot-frame", [("map-graph", "clickData")])
+
+    def slider(self):
+        low, high = self.years[0], self.years[-1]
+        start = self.rng.randint(low, high)
+        end = self.rng.randint(start, high)
+        # a drag fires an update at every step the handle passes
+        for step in range(start, end + 1):
+            self.values["year-slider"] = [start, step]
+            self._call("price-chart", [("year-slider", "value")])
+            self._call("line-chart", [("year-slider", "value")])
+
+    def multi(self):
+        picked = self.rng.sample(
+            self.global_countries, min(len(self.global_countries), 5)
+        )
+        self.values["country-dropdown"] = []
+        for country in picked:
+            self.values["country-dropdown"] = self.values["country-dropdown"] + [
+                country
+            ]
+            self._call("price-chart", [("country-dropdown", "value")])
+            self._call("line-chart", [("country-dropdown", "value")])
+
+    def run(self, scenarios, deadline, think_time):
+        self.country()
+        while time.perf_counter() < deadline:
+            getattr(self, self.rng.choice(scenarios))()
+            if think_time:
+                time.sleep(self.rng.expovariate(1 / think_time))
+
+
+def run_stage(client, users, duration, scenarios, think_time, seed):
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(
+            target=User(client, recorder, random.Random(seed + i)).run,
+            args=(scenarios, deadline, think_time),
+            daemon=True,
+        )
+        for i in range(users)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    results = {}
+    for callback, samples in sorted(recorder.samples.items()):
+        status = np.array([s for s, _ in samples])
+        ms = np.array([t for _, t in samples]) * 1000
+        # 204 is Dash's PreventUpdate, not a failure
+        errors = ~np.isin(status, [200, 204])
+        results[callback] = {
+            "requests": len(samples),
+            "rps": len(samples) / elapsed,
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)),
+            "error_rate": float(errors.mean()),
+        }
+    return results
+
+
+def print_results(results):
+    header = f"{'users':>6} {'callback':<16} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}"
+    print(header)
+    print("-" * len(header))
+    for users, callbacks in results.items():
+        for name, m in callbacks.items():
+            print(
+                f"{users:>6} {name:<16} {m['requests']:>9} {m['rps']:>8.1f} {m['p50_ms']:>9.1f} "
+                f"{m['p95_ms']:>9.1f} {m['p99_ms']:>9.1f} {m['error_rate']:>7.1%}"
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8050")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument(
+        "--duration", type=float, default=30, help="seconds per concurrency level"
+    )
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument(
+        "--think-time", type=float, default=0.5, help="mean pause between interactions"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    client = DashClient(args.url)
+
+    results = {}
+    for users in args.users:
+        print(f"running {users} users for {args.duration:g}s...", file=sys.stderr)
+        results[users] = run_stage(
+            client, users, args.duration, args.scenarios, args.think_time, args.seed
+        )
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
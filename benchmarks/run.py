@@ -0,0 +1,376 @@
+"""Benchmark every plot builder and callback against synthetic WFP data.
+
+    python -m benchmarks.run                      # 1x, 10x and 100x scales
+    python -m benchmarks.run --scales 1 10        # skip the 30M-row run
+    python -m benchmarks.run --save-baseline      # record the current numbers
+    python -m benchmarks.run --threshold 0.25     # fail on >25% regressions
+
+Each case reports latency percentiles, peak traced memory and the size of
+the serialized figure. Results are compared against the stored baseline and
+the exit status is 1 when any case regressed.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+import numpy as np
+from plotly.io.json import to_json_plotly
+
+from src.backend import DuckDBBackend, PandasBackend
+from src.cache import FigureCache
+from src.callback import register_callbacks
+from src.dataset import Dataset, DatasetHolder
+from src.data import prepare_data, build_aff_panel, get_years
+from src.store import write_wfp_store
+from src import plots
+
+from .synthetic import BASE_ROWS, make_wfp, load_inputs
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baseline.json"
+)
+
+
+class CallbackRecorder:
+    """Stands in for the Dash app and keeps the decorated callback functions."""
+
+    def __init__(self):
+        self.callbacks = {}
+
+    def callback(self, *args, **kwargs):
+        def decorator(func):
+            self.callbacks[func.__name__] = func
+            return func
+
+        return decorator
+
+    def clientside_callback(self, *args, **kwargs):
+        pass
+
+
+def payload_size(value):
+    if isinstance(value, tuple):
+        return sum(payload_size(v) for v in value)
+    if value is None or isinstance(value, (str, int, float)):
+        return len(json.dumps(value))
+    return len(to_json_plotly(value))
+
+
+def build_cases(tables, rng, duckdb_root=None):
+    """(name, kind, function, argument generator) for every benchmarked call."""
+    wfp, fao, fao_grouped, aff_index, _, wfp_index, _, price_cube, market_table = tables
+    aff_panel = build_aff_panel(aff_index)
+    backend = PandasBackend(wfp_index, price_cube, market_table)
+
+    # no caching: every call must do the real work
+    recorder = CallbackRecorder()
+    register_callbacks(
+        recorder,
+        DatasetHolder(Dataset("benchmark", tables)),
+        FigureCache(max_entries=0),
+    )
+    cb = recorder.callbacks
+
+    countries = sorted(wfp["country"].unique())
+    aff_years = sorted(aff_index["year"].unique())
+
+    def country_year():
+        country = countries[rng.integers(len(countries))]
+        years = get_years(wfp_index, country)
+        return country, years[rng.integers(len(years))]
+
+    def country_year_region():
+        country, year = country_year()
+        regions = sorted(wfp_index.regions(country, year))
+        region = regions[rng.integers(len(regions))] if rng.random() < 0.5 else None
+        return country, year, region
+
+    def selection():
+        picked = rng.choice(
+            countries, size=min(len(countries), rng.integers(1, 21)), replace=False
+        )
+        start = int(rng.integers(2014, 2020))
+        commodity = "Essential Commodities" if rng.random() < 0.5 else "All Commodities"
+        return list(picked), [start, int(rng.integers(start, 2025))], commodity
+
+    def add_country(callback, picked, *args):
+        # render a few countries, then add one: what a dropdown change sends
+        picked = picked[:5]
+        shown = callback(picked, *args, None)[1]
+        others = [c for c in countries if c not in picked]
+        return (picked + [others[rng.integers(len(others))]], *args, shown)
+
+    def selected(country, year):
+        # the "country-year" Store the Country tab's figures read
+        return {"country": country, "year": year}
+
+    def next_year():
+        country, year = country_year()
+        shown = cb["update_map"](selected(country, year), None)[1]
+        years = get_years(wfp_index, country)
+        return selected(country, years[(years.index(year) + 1) % len(years)]), shown
+
+    def click(region):
+        return {"points": [{"customdata": [region]}]} if region else None
+
+    def backend_cases(backend, suffix=""):
+        # the plot builders that read WFP rows through a backend
+        return [
+            (
+                f"get_price_chart{suffix}",
+                "plot",
+                plots.get_price_chart,
+                lambda: (backend, *selection()),
+            ),
+            (
+                f"get_map{suffix}",
+                "plot",
+                plots.get_map,
+                lambda: (backend, *country_year()),
+            ),
+            (
+                f"get_box_plot{suffix}",
+                "plot",
+                plots.get_box_plot,
+                lambda: (backend, *country_year_region()),
+            ),
+            (
+                f"get_box_plot(raw){suffix}",
+                "plot",
+                lambda *args: plots.get_box_plot(*args, precomputed=False),
+                lambda: (backend, *country_year_region()),
+            ),
+            (
+                f"get_bar_plot{suffix}",
+                "plot",
+                plots.get_bar_plot,
+                lambda: (backend, *country_year_region()),
+            ),
+        ]
+
+    cases = backend_cases(backend)
+    if duckdb_root is not None:
+        cases += backend_cases(DuckDBBackend(duckdb_root), "[duckdb]")
+
+    return cases + [
+        (
+            # every country over the whole range: the downsampled, WebGL case
+            "get_price_chart(all)",
+            "plot",
+            plots.get_price_chart,
+            lambda: (backend, countries, [2014, 2024], "All Commodities"),
+        ),
+        (
+            "get_undernourishment_chart",
+            "plot",
+            plots.get_undernourishment_chart,
+            lambda: (fao_grouped, *selection()[:2]),
+        ),
+        (
+            "get_hist",
+            "plot",
+            plots.get_hist,
+            lambda: (aff_panel, aff_years[rng.integers(len(aff_years))]),
+        ),
+        ("build_aff_panel", "plot", build_aff_panel, lambda: (aff_index,)),
+        # callbacks, from an empty chart
+        (
+            "update_price_chart",
+            "callback",
+            cb["update_price_chart"],
+            lambda: (*selection(), None),
+        ),
+        (
+            "update_undernourishment_chart",
+            "callback",
+            cb["update_undernourishment_chart"],
+            lambda: (*selection()[:2], None),
+        ),
+        (
+            "update_map",
+            "callback",
+            cb["update_map"],
+            lambda: (selected(*country_year()), None),
+        ),
+        # ... and from the previous selection, answered with a dash.Patch
+        (
+            "update_price_chart(+1)",
+            "callback",
+            cb["update_price_chart"],
+            lambda: add_country(cb["update_price_chart"], *selection()),
+        ),
+        (
+            "update_undernourishment_chart(+1)",
+            "callback",
+            cb["update_undernourishment_chart"],
+            lambda: add_country(cb["update_undernourishment_chart"], *selection()[:2]),
+        ),
+        ("update_map(year)", "callback", cb["update_map"], next_year),
+        (
+            "update_box_bar_plots",
+            "callback",
+            cb["update_box_bar_plots"],
+            lambda: (lambda c, y, r: (selected(c, y), click(r)))(
+                *country_year_region()
+            ),
+        ),
+        (
+            "update_country_year",
+            "callback",
+            cb["update_country_year"],
+            # a country change: the Store still holds the previous country
+            lambda: (*country_year(), selected(None, None)),
+        ),
+    ]
+
+
+def run_case(func, make_args, repeats):
+    func(*make_args())  # warm up imports and lazy plotly validators
+
+    times, sizes = [], []
+    for _ in range(repeats):
+        args = make_args()
+        start = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - start)
+        sizes.append(payload_size(result))
+
+    # peak memory is traced separately, tracemalloc slows the call down
+    args = make_args()
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times_ms = np.array(times) * 1000
+    return {
+        "p50_ms": float(np.percentile(times_ms, 50)),
+        "p95_ms": float(np.percentile(times_ms, 95)),
+        "p99_ms": float(np.percentile(times_ms, 99)),
+        "peak_mb": peak / 2**20,
+        "json_kb": float(np.mean(sizes)) / 1024,
+    }
+
+
+def run_scale(scale, repeats, seed, duckdb=False):
+    rng = np.random.default_rng(seed)
+    wfp_raw = make_wfp(int(BASE_ROWS * scale), seed=seed)
+    fao, aff_index = load_inputs()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # the DuckDB backend reads the same rows from a partitioned store
+        duckdb_root = None
+        if duckdb:
+            duckdb_root = os.path.join(tmp, "wfp_store")
+            write_wfp_store(wfp_raw, duckdb_root)
+
+        start = time.perf_counter()
+        tables = prepare_data(wfp_raw, fao, aff_index)
+        results = {"prepare_data": {"p50_ms": (time.perf_counter() - start) * 1000}}
+        del wfp_raw
+
+        for name, kind, func, make_args in build_cases(tables, rng, duckdb_root):
+            results[name] = dict(run_case(func, make_args, repeats), kind=kind)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Cases slower, heavier or larger than the baseline by more than `threshold`."""
+    regressions = []
+    for scale, cases in results.items():
+        for name, metrics in cases.items():
+            base = baseline.get(scale, {}).get(name)
+            if not base:
+                continue
+            # tail percentiles are too noisy on shared machines to gate on
+            for metric in ["p50_ms", "peak_mb", "json_kb"]:
+                if metric in metrics and metric in base and base[metric] > 0:
+                    change = metrics[metric] / base[metric] - 1
+                    if change > threshold:
+                        regressions.append(
+                            (scale, name, metric, base[metric], metrics[metric])
+                        )
+    return regressions
+
+
+def print_results(results):
+    header = f"{'scale':>6} {'case':<34} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak MB':>8} {'JSON KB':>8}"
+    print(header)
+    print("-" * len(header))
+    for scale, cases in results.items():
+        for name, m in cases.items():
+            print(
+                f"{scale:>6} {name:<34} {m['p50_ms']:>9.2f} {m.get('p95_ms', float('nan')):>9.2f} "
+                f"{m.get('p99_ms', float('nan')):>9.2f} {m.get('peak_mb', float('nan')):>8.1f} "
+                f"{m.get('json_kb', float('nan')):>8.1f}"
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--output", help="also write the results as JSON here")
+    parser.add_argument(
+        "--duckdb",
+        action="store_true",
+        help="also run the plot builders on the DuckDB backend",
+    )
+    args = parser.parse_args(argv)
+
+    results = {}
+    for scale in args.scales:
+        print(
+            f"running {scale:g}x ({int(BASE_ROWS * scale):,} rows)...", file=sys.stderr
+        )
+        results[f"{scale:g}x"] = run_scale(
+            scale, args.repeats, args.seed, duckdb=args.duckdb
+        )
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        baseline["_machine"] = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        }
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("no baseline stored yet, run with --save-baseline")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for scale, name, metric, before, after in regressions:
+        print(f"REGRESSION {scale} {name} {metric}: {before:.2f} -> {after:.2f}")
+    if not regressions:
+        print(f"no regressions over {args.threshold:.0%} against {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Compare figure payloads: plain plotly JSON against the compact encoding.
+
+    python -m benchmarks.serialize                  # 1x the current extract
+    python -m benchmarks.serialize --scale 10 --repeats 20
+
+Builds every callback figure from synthetic WFP data and reports, per
+figure, the serialized size and the time to encode it three ways: the plain
+figure with the standard json module (Dash without orjson), the plain
+figure with orjson, and `src.encoding.compact_figure` with orjson, which is
+what the callbacks now return.
+"""
+
+import sys
+import time
+import argparse
+
+import numpy as np
+from plotly.io.json import to_json_plotly
+
+from src import plots
+from src.backend import PandasBackend
+from src.data import prepare_data
+from src.encoding import compact_figure
+
+from .synthetic import BASE_ROWS, load_inputs, make_wfp
+
+
+def build_figures(tables):
+    _, _, fao_grouped, _, _, wfp_index, _, price_cube, market_table = tables
+    backend = PandasBackend(wfp_index, price_cube, market_table)
+    # the country-year with the most rows, as the heaviest country tab
+    country, year = max(
+        wfp_index.year_ranges,
+        key=lambda k: np.subtract(*wfp_index.year_ranges[k][::-1]),
+    )
+    countries = sorted(wfp_index.country_years)
+    return {
+        "price (5)": plots.get_price_chart(
+            backend, countries[:5], [2014, 2024], "All Commodities"
+        ),
+        "price (all)": plots.get_price_chart(
+            backend, countries, [2014, 2024], "All Commodities"
+        ),
+        "undernourishment": plots.get_undernourishment_chart(
+            fao_grouped, fao_grouped["Area"].unique()[:10].tolist(), [2014, 2024]
+        ),
+        "map": plots.get_map(backend, country, int(year)),
+        "box": plots.get_box_plot(backend, country, int(year)),
+        "box (raw)": plots.get_box_plot(backend, country, int(year), precomputed=False),
+        "bar": plots.get_bar_plot(backend, country, int(year)),
+    }
+
+
+def encoders():
+    return {
+        "json": lambda fig: to_json_plotly(fig.to_plotly_json(), engine="json"),
+        "orjson": lambda fig: to_json_plotly(fig.to_plotly_json(), engine="orjson"),
+        "compact": lambda fig: to_json_plotly(compact_figure(fig), engine="orjson"),
+    }
+
+
+def best_of(func, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    fao, aff_index = load_inputs()
+    tables = prepare_data(make_wfp(int(BASE_ROWS * args.scale)), fao, aff_index)
+    figures = build_figures(tables)
+
+    names = list(encoders())
+    header = "".join(f"{name + ' KB':>12}{name + ' ms':>12}" for name in names)
+    print(f"{'figure':<18}{header}{'smaller':>9}")
+    for name, fig in figures.items():
+        row = ""
+        sizes = []
+        for encode in encoders().values():
+            sizes.append(len(encode(fig)))
+            seconds = best_of(lambda: encode(fig), args.repeats)
+            row += f"{sizes[-1] / 1024:>12.1f}{seconds * 1000:>12.2f}"
+        print(f"{name:<18}{row}{1 - sizes[-1] / sizes[0]:>8.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""Profile the dashboard's cold start in fresh processes.
+
+    python -m benchmarks.startup                        # 5 runs, per-phase medians
+    python -m benchmarks.startup --runs 10 --budget 2.5 # exit 1 over budget
+    python -m benchmarks.startup --imports 15           # slowest imported packages
+    python -m benchmarks.startup --no-snapshot          # prepare the tables each run
+
+Every run starts a new interpreter, imports src.app and then serves the first
+page load through the Flask test client: the index, the layout and every
+callback the browser fires on load. The phases are the ones src.app marks in
+src.startup, plus the interpreter launch before the first mark and the first
+page load after the last one. The budget applies to the median time from
+launch to the end of the first page load.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def first_page(app):
+    """Serve what a browser requests on the first visit; returns the seconds taken."""
+    from .loadtest import DashClient
+
+    class TestClient(DashClient):
+        def __init__(self, client):
+            self.client = client
+            super().__init__("")
+
+        def _get(self, path):
+            return self.client.get(path).get_json()
+
+        def update(self, key, values, changed):
+            response = self.client.post(
+                "/_dash-update-component", json=self.body(key, values, changed)
+            )
+            return response.status_code
+
+    start = time.perf_counter()
+    client = app.server.test_client()
+    client.get("/")
+    dash = TestClient(client)
+    for key, dep in dash.dependencies.items():
+        if dep.get("prevent_initial_call"):
+            continue
+        values = {}
+        try:
+            for item in dep["inputs"] + dep["state"]:
+                values[item["id"]] = dash.props(item["id"]).get(item["property"])
+        except KeyError:
+            continue  # not in the initial layout
+        status = dash.update(key, values, [])
+        if status not in (200, 204):
+            raise RuntimeError(f"{key} answered {status} on the first page load")
+    return time.perf_counter() - start
+
+
+def child(spawned):
+    """Run in the fresh process: import the app, load the first page, print JSON."""
+    import src.app
+    from src import startup
+
+    # the startup clock starts at its first import, at the top of src.app
+    launch = time.time() - (time.perf_counter() - startup.STARTED) - spawned
+    phases = {"launch": launch, **startup.PHASES}
+    phases["first page"] = first_page(src.app.app)
+    print(json.dumps(phases))
+
+
+def run_once(env, importtime=False):
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += [
+        "-c",
+        f"from benchmarks.startup import child; child({time.time()!r})",
+    ]
+    result = subprocess.run(
+        command, cwd=ROOT, env=env, capture_output=True, text=True, check=False
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise RuntimeError("the app failed to start")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(stderr, count):
+    """Import time per top-level package from `-X importtime` output.
+
+    Sums every module's own (self) time into its package, so a package that
+    imports another is not charged for it.
+    """
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        own, _, name = line[len("import time:") :].split("|")
+        if own.strip().isdigit():
+            package = name.strip().split(".")[0]
+            totals[package] = totals.get(package, 0) + int(own) / 1e6
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--warmup", type=int, default=1, help="untimed runs, e.g. to build the snapshot"
+    )
+    parser.add_argument("--budget", type=float, help="seconds to a served first page")
+    parser.add_argument("--imports", type=int, default=0, metavar="N")
+    parser.add_argument("--no-snapshot", action="store_true")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    if args.no_snapshot:
+        env["WFP_SNAPSHOT"] = "0"
+
+    for _ in range(args.warmup):
+        run_once(env)
+    runs = [run_once(env)[0] for _ in range(args.runs)]
+
+    print(f"{'phase':<12} {'p50 s':>8} {'min s':>8} {'max s':>8}")
+    for phase in runs[0]:
+        seconds = [run[phase] for run in runs]
+        print(
+            f"{phase:<12} {statistics.median(seconds):>8.3f} "
+            f"{min(seconds):>8.3f} {max(seconds):>8.3f}"
+        )
+    totals = [sum(run.values()) for run in runs]
+    total = statistics.median(totals)
+    print(f"{'total':<12} {total:>8.3f} {min(totals):>8.3f} {max(totals):>8.3f}")
+
+    if args.imports:
+        _, stderr = run_once(env, importtime=True)
+        print(f"\n{'package':<28} {'import s':>8}")
+        for package, seconds in slowest_imports(stderr, args.imports):
+            print(f"{package:<28} {seconds:>8.3f}")
+
+    if args.budget is not None and total > args.budget:
+        print(f"\nover budget: {total:.3f} s > {args.budget:.3f} s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""WFP-shaped synthetic data, so benchmarks run offline without the parquet."""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+BASE_ROWS = 300_000  # roughly the size of the 2014+ WFP extract
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CATEGORIES = {
+    "cereals and tubers": [
+        "Rice",
+        "Wheat flour",
+        "Maize",
+        "Sorghum",
+        "Potatoes",
+        "Bread",
+    ],
+    "pulses and nuts": ["Beans", "Lentils", "Chickpeas", "Groundnuts"],
+    "vegetables and fruits": ["Tomatoes", "Onions", "Cabbage", "Bananas", "Garlic"],
+    "oil and fats": ["Oil (vegetable)", "Oil (palm)", "Butter"],
+    "meat, fish and eggs": ["Eggs", "Meat (beef)", "Meat (chicken)", "Fish (dry)"],
+    "milk and dairy": ["Milk", "Milk (powder)", "Cheese"],
+    "miscellaneous food": ["Sugar", "Salt", "Tea", "Fuel (diesel)"],
+}
+
+# (raw unit, standardized Unit, factor applied to usdprice)
+UNITS = [
+    ("KG", "1 KG", 1.0),
+    ("50 KG", "1 KG", 1 / 50),
+    ("500 G", "1 KG", 2.0),
+    ("L", "1 L", 1.0),
+    ("750 ML", "1 L", 1 / 0.75),
+    ("Pound", "1 KG", 2.20462),
+    ("Dozen", "1 Dozen", 1.0),
+    ("pcs", "1 piece", 1.0),
+    ("Unit", "Unit", 1.0),
+    ("Bunch", "Bunch", 1.0),
+]
+
+
+def _country_names(n_countries):
+    aff = pd.read_csv(
+        os.path.join(REPO_DIR, "data", "processed", "affordability_index.csv")
+    )
+    names = sorted(aff["country"].unique())[:n_countries]
+    names += [f"Country {i:02d}" for i in range(len(names), n_countries)]
+    iso = dict(zip(aff["country"], aff["countryiso3"]))
+    return names, [iso.get(name, f"X{i:02d}") for i, name in enumerate(names)]
+
+
+def make_wfp(n_rows=BASE_ROWS, n_countries=98, markets_per_country=30, seed=0):
+    """Return a frame with the columns and value shapes of wfp_preprocessed.parquet.
+
+    Country sizes are skewed (a few very large countries, like Nigeria or
+    Yemen in the real data), every country has `markets_per_country` markets
+    spread over a third as many admin2 regions, and dates are monthly from
+    2014 to 2024. String columns are built as categoricals to keep the
+    generator itself cheap at 100x scale.
+    """
+    rng = np.random.default_rng(seed)
+    countries, iso3 = _country_names(n_countries)
+
+    weights = 1 / np.arange(1, n_countries + 1) ** 0.8
+    country = rng.choice(n_countries, size=n_rows, p=weights / weights.sum())
+    local_market = rng.integers(0, markets_per_country, n_rows)
+    market = country * markets_per_country + local_market
+    admin2 = country * markets_per_country + local_market // 3
+
+    months = pd.date_range("2014-01-15", "2024-12-15", freq="MS") + pd.Timedelta(
+        days=14
+    )
+    date = months[rng.integers(0, len(months), n_rows)]
+
+    commodities = [(cat, com) for cat, coms in CATEGORIES.items() for com in coms]
+    commodity = rng.integers(0, len(commodities), n_rows)
+    category_labels = list(CATEGORIES)
+    commodity_category = np.array(
+        [category_labels.index(cat) for cat, _ in commodities]
+    )
+    unit = rng.integers(0, len(UNITS), n_rows)
+
+    # market coordinates around a per-country centre
+    centre_lat = rng.uniform(-30, 40, n_countries)
+    centre_lon = rng.uniform(-90, 120, n_countries)
+    market_lat = np.repeat(centre_lat, markets_per_country) + rng.normal(
+        0, 2, n_countries * markets_per_country
+    )
+    market_lon = np.repeat(centre_lon, markets_per_country) + rng.normal(
+        0, 2, n_countries * markets_per_country
+    )
+
+    usdprice = rng.lognormal(0, 1, n_rows)
+    factors = np.array([factor for _, _, factor in UNITS])
+
+    def categorical(codes, labels):
+        return pd.Categorical.from_codes(codes, categories=labels)
+
+    market_labels = [
+        f"{c} market {m}" for c in countries for m in range(markets_per_country)
+    ]
+    admin2_labels = [
+        f"{c} region {m}" for c in countries for m in range(markets_per_country)
+    ]
+    unit_labels = [u for u, _, _ in UNITS]
+    std_unit_labels = sorted({s for _, s, _ in UNITS})
+    std_unit = np.array([std_unit_labels.index(s) for _, s, _ in UNITS])
+
+    return pd.DataFrame(
+        {
+            "date": date,
+            "admin1": categorical(country, [f"{c} province" for c in countries]),
+            "admin2": categorical(admin2, admin2_labels),
+            "market": categorical(market, market_labels),
+            "latitude": market_lat[market],
+            "longitude": market_lon[market],
+            "category": categorical(commodity_category[commodity], category_labels),
+            "commodity": categorical(commodity, [com for _, com in commodities]),
+            "unit": categorical(unit, unit_labels),
+            "priceflag": categorical(np.zeros(n_rows, dtype="int8"), ["actual"]),
+            "pricetype": categorical(
+                rng.integers(0, 2, n_rows), ["Retail", "Wholesale"]
+            ),
+            "currency": categorical(country, [f"C{i:02d}" for i in range(n_countries)]),
+            "price": usdprice * 100,
+            "usdprice": usdprice,
+            "countryiso3": categorical(country, iso3),
+            "country": categorical(country, countries),
+            "Value": 1.0,
+            "Unit": categorical(std_unit[unit], std_unit_labels),
+            "standardprice": usdprice * factors[unit],
+        }
+    )
+
+
+def load_inputs():
+    """The small real inputs that ship with the repo (FAO and affordability)."""
+    fao = pd.read_csv(
+        os.path.join(REPO_DIR, "data", "raw", "FAOSTAT_data_en_nutrition.csv")
+    )
+    aff_index = pd.read_csv(
+        os.path.join(REPO_DIR, "data", "processed", "affordability_index.csv")
+    )
+    return fao, aff_index
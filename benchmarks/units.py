@@ -0,0 +1,131 @@
+"""Time unit standardization against the per-unit mask passes of notebook 3.
+
+    python -m benchmarks.units                      # 1M, 5M and 10M rows
+    python -m benchmarks.units --rows 2000000 --repeats 5
+
+Both implementations run on the same synthetic frame; the script checks that
+they agree on every row before timing them, with `notebook_labels=True` so
+the unit labels follow the notebook's overlapping substring rules.
+"""
+
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from src.units import standardize_units
+
+# units seen in the WFP extract, roughly in order of frequency
+UNIT_MIX = [
+    "KG", "50 KG", "500 G", "L", "Unit", "pcs", "Pound", "100 KG", "MT",
+    "Dozen", "Bunch", "Head", "Loaf", "Gallon", "Tin (20 L)", "750 ML",
+    "400 G", "25 KG", "Tubers", "Packet", "Pounds", "10 pcs", "Heap",
+    "Dozens", "Box", "Bundle", "Package", "Pile", "Marmite", "Cuartilla",
+    "Tin(20 L)", "5 Pound", "2 Dozen", "10 piece", "Large",
+]  # fmt: skip
+COMMODITIES = ["Rice", "Maize", "Eggs", "Oil (vegetable)", "Beans", "Milk"]
+
+
+def make_frame(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, len(UNIT_MIX) + 1)
+    return pd.DataFrame(
+        {
+            "unit": rng.choice(UNIT_MIX, size=n_rows, p=weights / weights.sum()),
+            "commodity": rng.choice(COMMODITIES, size=n_rows),
+            "usdprice": rng.lognormal(0, 1, size=n_rows),
+        }
+    )
+
+
+def notebook_standardize(df):
+    """The mask-per-unit conversion from reports/3_feature_engineering.ipynb."""
+    df["Value"] = df["unit"].str.extract(r"^(\d*\.?\d+)")
+    df["Unit"] = df["unit"].str.extract(r"^[\d\.]*\s*(.*)")
+    df["Value"] = df["Value"].fillna("1").astype(float)
+
+    conversions = [
+        ("KG", lambda p, v: p / v),
+        ("G", lambda p, v: p / v * 1000),
+        ("L", lambda p, v: p / v),
+        ("ML", lambda p, v: p / v * 1000),
+        ("Pounds", lambda p, v: p / v * 2.20462),
+        ("Pound", lambda p, v: p * 2.20462),
+        ("pcs", lambda p, v: p / v),
+        ("MT", lambda p, v: p / v / 1000),
+        ("Tin (20 L)", lambda p, v: p / v / 20),
+        ("Gallon", lambda p, v: p / v * 0.264172),
+        ("Tubers", lambda p, v: p / v),
+        ("Dozens", lambda p, v: p / v),
+    ]
+    for unit, convert in conversions:
+        mask = df["Unit"] == unit
+        df.loc[mask, "standardprice"] = convert(
+            df.loc[mask, "usdprice"], df.loc[mask, "Value"]
+        )
+    missing = df["standardprice"].isna()
+    df.loc[missing, "standardprice"] = df.loc[missing, "usdprice"]
+
+    labels = [
+        ("KG", "1 KG"), ("G", "1 KG"), ("L", "1 L"), ("ML", "1 L"),
+        ("Pounds", "1 KG"), ("Pound", "1 KG"), ("MT", "1 KG"), ("pcs", "1 piece"),
+        ("Gallon", "1 L"), ("piece", "1 piece"), ("Tubers", "1 Tuber"),
+        ("Dozen", "1 Dozen"), ("Dozens", "1 Dozen"),
+    ]  # fmt: skip
+    for pattern, label in labels:
+        df.loc[df["unit"].str.contains(pattern, na=False), "Unit"] = label
+
+    # two masks, as in the notebook: the second is built after the relabel,
+    # matches nothing, and the x12 never applies
+    eggs = df["commodity"].str.contains("Eggs")
+    df.loc[eggs & df["Unit"].isin(["1 piece", "Unit"]), "Unit"] = "1 Dozen"
+    df.loc[eggs & df["Unit"].isin(["1 piece", "Unit"]), "standardprice"] *= 12
+    return df
+
+
+def check(n_rows=200_000):
+    expected = notebook_standardize(make_frame(n_rows, seed=1))
+    actual = standardize_units(make_frame(n_rows, seed=1), notebook_labels=True)
+    for column in ["Value", "Unit", "standardprice"]:
+        a, e = actual[column], expected[column]
+        if column == "standardprice":
+            same = np.isclose(a, e, rtol=1e-9)
+        else:
+            same = a.to_numpy() == e.to_numpy()
+        if not same.all():
+            raise AssertionError(f"{column} differs from the notebook")
+
+
+def best_of(func, make_df, repeats):
+    times = []
+    for _ in range(repeats):
+        df = make_df()
+        start = time.perf_counter()
+        func(df)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[1_000_000, 5_000_000, 10_000_000]
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    check()
+
+    print(f"{'rows':>12} {'notebook s':>11} {'vectorized s':>13} {'speedup':>8}")
+    for n_rows in args.rows:
+        frame = make_frame(n_rows)
+        old = best_of(notebook_standardize, frame.copy, args.repeats)
+        new = best_of(standardize_units, frame.copy, args.repeats)
+        print(f"{n_rows:>12,} {old:>11.2f} {new:>13.2f} {old / new:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
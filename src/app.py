@@ -1,228 +1,345 @@
+import os
+
+from . import startup  # first, so the startup clock also covers the imports
+
 import dash
 from dash import dcc, html
 import dash_bootstrap_components as dbc
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 
-from .data import load_data, get_globals, get_years, get_aff_years, ESSENTIAL_COMMODITIES
-from .plots import get_hist
+from .data import wfp_years_from_env
+from .dataset import DatasetHolder, load_dataset
+from .cache import FigureCache
+from .ingest import cache_predicate
+from .metrics import instrument, register_endpoint
 from .callback import register_callbacks
-from .styles import tabs_style, stat_card_container_style, stat_card_row_style, graph_container_style, map_style, double_graph_style, affo_country_style, bar_box_style, tooltip_style
+from .styles import tabs_style, stat_card_container_style, stat_card_row_style, graph_container_style, map_style, double_graph_style, affo_country_style, bar_box_style, tooltip_style, country_card_style
+
+startup.mark("imports")
 
 
-# Load data
-wfp, fao, fao_grouped, aff_index, commodity_country_set = load_data()
-all_countries, min_year, max_year = get_globals(wfp)
+# Load data; newer snapshots are swapped in later without a restart
+def load(previous=None, changed=None):
+    return load_dataset(
+        years=wfp_years_from_env(), previous=previous, changed=changed
+    )
 
-default_country = all_countries[0]
-default_year = get_years(wfp, default_country)[0]
 
-aff_years = get_aff_years(aff_index) # list of years in descending order; doesn't match wfp years
+holder = DatasetHolder(load(), loader=load)
+startup.mark("load data")
 
 
 # ================================= APP =================================
 
 app = dash.Dash(
-    __name__, external_stylesheets=[dbc.themes.ZEPHYR, dbc.icons.FONT_AWESOME]
+    __name__, external_stylesheets=[dbc.themes.ZEPHYR, dbc.icons.FONT_AWESOME],
+    # callbacks may target tabs that have not been opened yet, see render_tab
+    suppress_callback_exceptions=True,
 )
 
-app.layout = dbc.Container([
-    # header
-    html.Div([
-        html.H1("Global Food Security Dashboard")
-    ]),
-
-    # tabs
-    dbc.Row([
-        dbc.Tabs([
-            # ================ GLOBAL TAB ================
-            dbc.Tab(label="Global", tab_id="global", children=[
-                # affordability row
-                dbc.Row([
-                    # histogram
-                    dbc.Col([
-                        dbc.Row([
-                            dbc.Col([
-                                html.H4("Global Distribution of Affordability Ratios"),
-                                html.P("Affordability ratio is calculated as (Local Price / Mean National Wage)")
-                            ], width=9),
-                            dbc.Col([
-                                dcc.Dropdown(
-                                    id="year-dropdown", value=max(aff_years), clearable=False,
-                                    options=[{"label": year, "value": year} for year in aff_years]
-                                )
-                            ], width=2)
-                        ]),
-                        dbc.Row(
-                            dcc.Graph(id="aff-hist")
-                        )
-                    ], width=8, style={"margin": "1rem 0 0"}),
 
-                    # summary statistics
-                    dbc.Col([
-                        html.Div([
-                            dbc.Row(html.H5("Total Countries Included")),
-                            dbc.Row([
-                                dbc.Col(html.H1(f"{len(all_countries)}"))
-                            ], style=stat_card_row_style)
-                        ], style=stat_card_container_style),
+# ================ GLOBAL TAB ================
+def global_tab(data):
+    all_countries, min_year, max_year = data.all_countries, data.min_year, data.max_year
+    aff_years = data.aff_years
 
-                        html.Div([
-                            dbc.Row([
-                                html.Div([
-                                    html.H5("Average Affordability Index", style={"display": "inline-block", "margin-right": "5px"}),
-                                    html.Sup("?", id="avg-change-info", style=tooltip_style),
-                                    dbc.Tooltip(
-                                        "Average food affordability in developing countries—higher values indicate better affordability.",
-                                        target="avg-change-info",
-                                        placement="right"
-                                    )
-                                ], style={"display": "flex", "align-items": "center"})
-                            ]),
-                            dbc.Row([
-                                dbc.Col(html.H1(id="avg-aff-index")), 
-                                dbc.Col(html.H5(id="avg-change-text"))
-                            ], style=stat_card_row_style)
-                        ], style=stat_card_container_style),
+    return [
+        # what the line charts show, for partial updates
+        dcc.Store(id="price-chart-shown"),
+        dcc.Store(id="line-chart-shown"),
 
-                        html.Div([
-                            dbc.Row(html.H5("Countries Under Average Affordability")),
-                            dbc.Row([
-                                dbc.Col(html.H1(id="pct-countries-under-avg")),
-                                dbc.Col(html.H5(id="pct-change-text"))
-                            ], style=stat_card_row_style)
-                        ], style=stat_card_container_style)
-                    ], width=4)
-
-                ], style={
-                    "border": "1px solid #ccc",
-                    "padding": "1rem",
-                    "margin": "1rem 0",
-                }),
-
-                # filters
+        # affordability row
+        dbc.Row([
+            # histogram
+            dbc.Col([
                 dbc.Row([
                     dbc.Col([
-                        html.Label("Select Countries:", className="fw-bold"),
-                        dcc.Dropdown(
-                            id="country-dropdown", multi=True, clearable=False,
-                            options=[{"label": c, "value": c} for c in all_countries],
-                            # value=["Russia", "China", "Vietnam", "Thailand"]
-                            value=["Afghanistan", "Armenia", "Bangladesh", "Guinea"]
-                        )
-                    ], width=3),
-
+                        html.H4("Global Distribution of Affordability Ratios"),
+                        html.P("Affordability ratio is calculated as (Local Price / Mean National Wage)")
+                    ], width=9),
                     dbc.Col([
-                        html.Label("Select Commodity:", className="fw-bold"),
                         dcc.Dropdown(
-                            id="commodity-dropdown", value="All Commodities",
-                            options=[{"label": "All Commodities", "value": "All Commodities"}, {"label": "Essential Commodities", "value": "Essential Commodities"}]
-                        )
-                    ], width=3),
-
-                    dbc.Col([
-                        html.Label("Select Year Range:", className="fw-bold"),
-                        dcc.RangeSlider(
-                            id="year-slider", min=min_year, max=max_year, value=[min_year, max_year],
-                            marks={year: str(year) for year in range(min_year, max_year + 1)},
-                            step=1
+                            id="year-dropdown", value=max(aff_years), clearable=False,
+                            options=[{"label": year, "value": year} for year in aff_years]
                         )
-                    ], width=6)
+                    ], width=2)
                 ]),
+                dbc.Row(
+                    dcc.Graph(id="aff-hist")
+                )
+            ], width=8, style={"margin": "1rem 0 0"}),
 
-                # change in global commodity prices and undernourishment
-                dbc.Row([
-                    dbc.Col([
-                        html.H4("Global Changes in Food Commodity Prices"),
-                        html.P(
-                            # "Essential Commodities include Sugar, Wheat flour, Eggs, "
-                            "Potatoes, Salt, Fuel, Tomatoes, Rice, Oil, and Onions",
-                            style={"color": "#777"}
-                        ),
-                        dcc.Graph(id="price-chart", config={"responsive": True}, style=double_graph_style)
-                    ], width="auto", style=graph_container_style),
+            # summary statistics
+            dbc.Col([
+                html.Div([
+                    dbc.Row(html.H5("Total Countries Included")),
+                    dbc.Row([
+                        dbc.Col(html.H1(f"{len(all_countries)}"))
+                    ], style=stat_card_row_style)
+                ], style=stat_card_container_style),
 
-                    dbc.Col([
-                        html.H4("Percentage of Population that is Undernourished"),
-                        html.P(
-                            "Data covers the last 10 years, with the most recent from 2021",
-                            style={"color": "#777"}
-                        ),
-                        dcc.Graph(id="line-chart", config={"responsive": True}, style=double_graph_style)
-                    ], width="auto", style=graph_container_style)
-
-                ], style={
-                    "display": "flex",  # Apply Flexbox layout
-                    "justify-content": "space-evenly",  # Evenly space the columns
-                    "align-items": "flex-start",  # Align columns at the top
-                })
-            ]),
-
-            # ================ COUNTRY TAB ================
-            dbc.Tab(label="Country", tab_id="country", children=[
-                # filters
-                dbc.Row([
-                    dbc.Col([
-                        html.Label("Select Country", className="fw-bold"),
-                        dcc.Dropdown(
-                            id="country", value=default_country, clearable=False,
-                            options=[{"label": i, "value": i} for i in all_countries],
-                        )
-                    ], width=3),
+                html.Div([
+                    dbc.Row([
+                        html.Div([
+                            html.H5("Average Affordability Index", style={"display": "inline-block", "margin-right": "5px"}),
+                            html.Sup("?", id="avg-change-info", style=tooltip_style),
+                            dbc.Tooltip(
+                                "Average food affordability in developing countries—higher values indicate better affordability.",
+                                target="avg-change-info",
+                                placement="right"
+                            )
+                        ], style={"display": "flex", "align-items": "center"})
+                    ]),
+                    dbc.Row([
+                        dbc.Col(html.H1(id="avg-aff-index")), 
+                        dbc.Col(html.H5(id="avg-change-text"))
+                    ], style=stat_card_row_style)
+                ], style=stat_card_container_style),
 
-                    dbc.Col([
-                        html.Label("Select Year", className="fw-bold"),
-                        dcc.Dropdown(
-                            id="year", value=default_year, clearable=False, className="mb-3",
-                            options=[{"label": i, "value": i} for i in get_years(wfp, default_country)]
-                        )
-                    ], width=2)
-                ]),
-                 # Add a note for users
-                dbc.Row(
+                html.Div([
+                    dbc.Row(html.H5("Countries Under Average Affordability")),
+                    dbc.Row([
+                        dbc.Col(html.H1(id="pct-countries-under-avg")),
+                        dbc.Col(html.H5(id="pct-change-text"))
+                    ], style=stat_card_row_style)
+                ], style=stat_card_container_style)
+            ], width=4)
+
+        ], style={
+            "border": "1px solid #ccc",
+            "padding": "1rem",
+            "margin": "1rem 0",
+        }),
+
+        # filters
+        dbc.Row([
+            dbc.Col([
+                html.Label("Select Countries:", className="fw-bold"),
+                dcc.Dropdown(
+                    id="country-dropdown", multi=True, clearable=False,
+                    options=[{"label": c, "value": c} for c in all_countries],
+                    # value=["Russia", "China", "Vietnam", "Thailand"]
+                    value=["Afghanistan", "Armenia", "Bangladesh", "Guinea"]
+                )
+            ], width=3),
+
+            dbc.Col([
+                html.Label("Select Commodity:", className="fw-bold"),
+                dcc.Dropdown(
+                    id="commodity-dropdown", value="All Commodities",
+                    options=[{"label": "All Commodities", "value": "All Commodities"}, {"label": "Essential Commodities", "value": "Essential Commodities"}]
+                )
+            ], width=3),
+
+            dbc.Col([
+                html.Label("Select Year Range:", className="fw-bold"),
+                dcc.RangeSlider(
+                    id="year-slider", min=min_year, max=max_year, value=[min_year, max_year],
+                    marks={year: str(year) for year in range(min_year, max_year + 1)},
+                    step=1
+                )
+            ], width=6)
+        ]),
+
+        # change in global commodity prices and undernourishment
+        dbc.Row([
+            dbc.Col([
+                html.H4("Global Changes in Food Commodity Prices"),
+                html.P(
+                    # "Essential Commodities include Sugar, Wheat flour, Eggs, "
+                    "Potatoes, Salt, Fuel, Tomatoes, Rice, Oil, and Onions",
+                    style={"color": "#777"}
+                ),
+                dcc.Graph(id="price-chart", config={"responsive": True}, style=double_graph_style)
+            ], width="auto", style=graph_container_style),
+
+            dbc.Col([
+                html.H4("Percentage of Population that is Undernourished"),
+                html.P(
+                    "Data covers the last 10 years, with the most recent from 2021",
+                    style={"color": "#777"}
+                ),
+                dcc.Graph(id="line-chart", config={"responsive": True}, style=double_graph_style)
+            ], width="auto", style=graph_container_style)
+
+        ], style={
+            "display": "flex",  # Apply Flexbox layout
+            "justify-content": "space-evenly",  # Evenly space the columns
+            "align-items": "flex-start",  # Align columns at the top
+        })
+    ]
+
+
+# ================ COUNTRY TAB ================
+def country_tab(data):
+    all_countries = data.all_countries
+    default_country, default_year = data.default_country, data.default_year
+
+    return [
+        # what the map shows, for partial updates
+        dcc.Store(id="map-graph-shown"),
+        # the selected (country, year), see update_country_year
+        dcc.Store(id="country-year", data={"country": default_country, "year": default_year}),
+
+        # filters
+        dbc.Row([
+            dbc.Col([
+                html.Label("Select Country", className="fw-bold"),
+                dcc.Dropdown(
+                    id="country", value=default_country, clearable=False,
+                    options=[{"label": i, "value": i} for i in all_countries],
+                )
+            ], width=3),
+
+            dbc.Col([
+                html.Label("Select Year", className="fw-bold"),
+                dcc.Dropdown(
+                    id="year", value=default_year, clearable=False, className="mb-3",
+                    options=[{"label": i, "value": i} for i in data.backend.years(default_country)]
+                )
+            ], width=2)
+        ]),
+         # Add a note for users
+        dbc.Row(
+            html.Div(
+                "Click a region on the map below to filter the box plot and bar plot.",
+                style={"fontStyle": "italic", "marginBottom": "1rem"}
+            )
+        ),
+        dbc.Row([
+            # ------------ MAP ------------
+            dbc.Col([
+                html.Div([
+                    html.H5("Food Price Volatility Across Regions"),
                     html.Div(
-                        "Click a region on the map below to filter the box plot and bar plot.",
-                        style={"fontStyle": "italic", "marginBottom": "1rem"}
+                        dcc.Graph(
+                            id="map-graph",
+                            config={"responsive": True},
+                            style={"height": "100%", "width": "100%"}
+                        ), style=map_style
                     )
-                ),
-                dbc.Row([
-                    # ------------ MAP ------------
-                    dbc.Col([
-                        html.Div([
-                            html.H5("Food Price Volatility Across Regions"),
-                            html.Div(
-                                dcc.Graph(
-                                    id="map-graph",
-                                    config={"responsive": True},
-                                    style={"height": "100%", "width": "100%"}
-                                ), style=map_style
-                            )
-                        ])
-                    ], width=5, style={"padding": "1rem"}), 
+                ])
+            ], width=5, style={"padding": "1rem"}), 
 
-                    # ------------ Boxplot & Barplot ------------
-                    dbc.Col([
-                        html.Div([
-                            dcc.Store(id="average-store", data=aff_index.to_dict("records")),
-                            html.Div(id="country-info",style={"margin-top": "20px", "width": "100%"}) 
-                        ], style=affo_country_style),
-                        
-                        html.Div([
-                            html.H5("Price Distribution for Category of Commodity"),
-                            dcc.Graph(id="boxplot-frame", style=bar_box_style)
-                        ]),
-                        html.Br(),
+            # ------------ Boxplot & Barplot ------------
+            dbc.Col([
+                html.Div([
+                    html.Div([
+                        html.P("No data available", id="country-info-empty", className="text-center text-muted fs-4"),
+                        html.Div(
+                            dbc.Card([
+                                dbc.CardHeader(html.H5(id="country-info-title", className="text-center fw-bold")),
+                                dbc.CardBody([
+                                    html.P(id="country-info-value", className="text-center fw-bold text-primary display-3"),
+                                    html.P(id="country-info-yoy", className="text-center fw-bold text-muted fs-5")
+                                ], className="d-flex flex-column align-items-center justify-content-center", style={"height": "150px"})
+                            ], className="md-5 shadow-sm", style=country_card_style),
+                            id="country-info-card", style={"display": "none"}
+                        )
+                    ], id="country-info", style={"margin-top": "20px", "width": "100%"})
+                ], style=affo_country_style),
 
-                        html.Div([
-                            html.H5("Top 20 Commodities by Average Price"),
-                            dcc.Graph(id="bar-frame", style=bar_box_style)
-                        ])
-                    ], width=6)
+                html.Div([
+                    html.H5("Price Distribution for Category of Commodity"),
+                    dcc.Graph(id="boxplot-frame", style=bar_box_style)
+                ]),
+                html.Br(),
+
+                html.Div([
+                    html.H5("Top 20 Commodities by Average Price"),
+                    dcc.Graph(id="bar-frame", style=bar_box_style)
                 ])
-            ])
-        ], id="tabs", active_tab="global", style=tabs_style)
-    ], justify="start", style={"padding": "0px 50px"})
-], fluid=True)
+            ], width=6)
+        ])
+    ]
+
+
+# Only the active tab is built with the page. The others are built by
+# render_tab the first time they are selected, so their callbacks do not
+# run on page load.
+TABS = {"global": global_tab, "country": country_tab}
+ACTIVE_TAB = "global"
+
+
+def serve_layout():
+    # built on every page load, so the dropdowns and the affordability panel
+    # follow the current dataset
+    data = holder.get()
+
+    return dbc.Container([
+        # header
+        html.Div([
+            html.H1("Global Food Security Dashboard")
+        ]),
+
+        # precomputed affordability summary, histogram bins and country cards
+        dcc.Store(id="aff-panel", data=data.aff_store),
+        # tabs whose content has been built
+        dcc.Store(id="rendered-tabs", data=[ACTIVE_TAB]),
+
+        # tabs
+        dbc.Row([
+            dbc.Tabs([
+                dbc.Tab(label="Global", tab_id="global", children=tab_content("global", data)),
+                dbc.Tab(label="Country", tab_id="country", children=tab_content("country", data)),
+            ], id="tabs", active_tab=ACTIVE_TAB, style=tabs_style)
+        ], justify="start", style={"padding": "0px 50px"})
+    ], fluid=True)
+
+
+def tab_content(tab, data):
+    children = TABS[tab](data) if tab == ACTIVE_TAB else None
+    return html.Div(children, id=f"{tab}-tab-content")
+
+
+@app.callback(
+    [Output(f"{tab}-tab-content", "children") for tab in TABS] + [Output("rendered-tabs", "data")],
+    Input("tabs", "active_tab"),
+    State("rendered-tabs", "data"),
+    prevent_initial_call=True,
+)
+def render_tab(active_tab, rendered):
+    # built once; dbc.Tabs keeps the content of a tab after leaving it
+    if active_tab in rendered:
+        raise PreventUpdate
+    data = holder.get()
+    content = [TABS[tab](data) if tab == active_tab else dash.no_update for tab in TABS]
+    return content + [rendered + [active_tab]]
+
+
+app.layout = serve_layout
+startup.mark("app")
+
+figure_cache = FigureCache.from_env(version=holder.version)
+register_callbacks(instrument(app), holder, figure_cache)
+startup.mark("callbacks")
+
+
+@holder.on_swap
+def switch_cache_version(old, new, changed):
+    # after an incremental ingest, keep the figures it did not touch
+    keep = None
+    if changed is not None:
+        stale = cache_predicate(changed)
+        keep = lambda key: not stale(key)
+    figure_cache.set_version(new.version, keep=keep)
+
+
+server = app.server
+register_endpoint(server, figure_cache)  # /metrics when METRICS_ENABLED=1
+# X-Data-Version on every response, POST /reload, and polling for new data
+reload_interval = float(os.environ.get("DATA_RELOAD_INTERVAL", 0))
+holder.register(server, reload_interval=reload_interval)
+
+
+# figure cache hit/miss counters for this worker
+@server.route("/cache-stats")
+def cache_stats():
+    return figure_cache.stats()
 
-register_callbacks(app, wfp, aff_index, fao_grouped, ESSENTIAL_COMMODITIES)
+startup.mark("routes")
+startup.done()
 
 # run server
 if __name__ == "__main__":
@@ -0,0 +1,41 @@
+// Clientside callbacks for the affordability widgets. Everything is
+// precomputed by data.build_aff_panel, so these only look values up.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    affordability: {
+        hist: function (year, panel) {
+            const data = panel.hist.data[String(year)] || [];
+            return {data: data, layout: panel.hist.layout};
+        },
+
+        summary: function (year, panel) {
+            const entry = panel.summary[String(year)];
+            if (!entry) {
+                return window.dash_clientside.no_update;
+            }
+            return [
+                entry.avg_text,
+                entry.pct_text,
+                entry.avg_change_text,
+                entry.pct_change_text,
+                entry.avg_change_style,
+                entry.pct_change_style,
+            ];
+        },
+
+        country: function (selected, panel) {
+            const country = selected.country;
+            const entry = panel.countries[country + "|" + selected.year];
+            if (!entry) {
+                return ["", "", "", "", {display: "none"}, {}];
+            }
+            return [
+                "Affordability Index for " + country,
+                entry[0],
+                entry[1],
+                "text-center fw-bold " + entry[2] + " fs-5",
+                {},
+                {display: "none"},
+            ];
+        },
+    },
+});
@@ -0,0 +1,439 @@
+"""Data access for the WFP plots.
+
+The plot builders ask a backend for the small, aggregated frames they draw
+and never touch the WFP rows themselves. `PandasBackend` answers from the
+in-memory tables of a Dataset and is the reference implementation.
+`DuckDBBackend` answers with SQL over the partitioned parquet store, so the
+rows stay on disk and every aggregate runs on all cores.
+
+Set DATA_BACKEND=duckdb to serve from DuckDB (`pip install duckdb`).
+"""
+
+import os
+import logging
+from urllib.parse import unquote
+
+import numpy as np
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:  # optional, only needed for DATA_BACKEND=duckdb
+    duckdb = None
+
+from . import kernels
+from .data import DATA_PATH, WFP_STORE, ESSENTIAL_COMMODITIES, get_globals
+from .store import resolve_store
+
+logger = logging.getLogger(__name__)
+
+BACKEND = os.environ.get("DATA_BACKEND", "pandas")
+
+MAP_COLUMNS = ["admin2", "latitude", "longitude", "standardprice"]
+BAR_KEYS = ["category", "commodity", "Unit"]
+
+
+def _empty_price_series():
+    """A price_series result without rows, typed like one with rows."""
+    return pd.DataFrame(
+        {
+            "country": pd.Series(dtype=object),
+            "date": pd.Series(dtype="datetime64[ns]"),
+            "avg_usdprice": pd.Series(dtype="float64"),
+        }
+    )
+
+
+def box_stats(df, max_outliers, by="category", value="standardprice"):
+    """Quartiles, whiskers and a capped outlier sample per group.
+
+    Quartiles and whiskers follow plotly's defaults, so the box matches the
+    one plotly.js computes from the points: quartiles are interpolated at
+    p * n - 0.5 (numpy's "hazen" method, not pandas' (n - 1) * p) and the
+    whiskers reach the most extreme points within 1.5 * IQR of them.
+    Outliers are the points beyond the whiskers, keeping at most
+    `max_outliers` of the most extreme per group.
+    """
+    # px.box ignores missing prices; kept, they would fail both fence
+    # comparisons below and be drawn as outliers
+    df = df[df[value].notna()]
+    keys = df[by].astype(str)
+    values = df[value]
+
+    grouped = values.groupby(keys, sort=False)
+    stats = pd.DataFrame(
+        {
+            "q1": grouped.agg(np.quantile, 0.25, method="hazen"),
+            "median": grouped.agg(np.quantile, 0.5, method="hazen"),
+            "q3": grouped.agg(np.quantile, 0.75, method="hazen"),
+        }
+    ).reindex(keys.unique())
+
+    iqr = stats["q3"] - stats["q1"]
+    low = (stats["q1"] - 1.5 * iqr).reindex(keys).to_numpy()
+    high = (stats["q3"] + 1.5 * iqr).reindex(keys).to_numpy()
+    inside = (values.to_numpy() >= low) & (values.to_numpy() <= high)
+
+    stats["lowerfence"] = values[inside].groupby(keys[inside]).min()
+    stats["upperfence"] = values[inside].groupby(keys[inside]).max()
+
+    outliers = pd.DataFrame({by: keys[~inside], value: values[~inside]})
+    distance = (
+        outliers[value] - stats["median"].reindex(outliers[by]).to_numpy()
+    ).abs()
+    outliers = (
+        outliers.assign(distance=distance)
+        .sort_values("distance", ascending=False)
+        .groupby(by, sort=False)
+        .head(max_outliers)
+        .drop(columns="distance")
+    )
+    return stats, outliers
+
+
+class PandasBackend:
+    """Reference backend over the precomputed in-memory tables."""
+
+    name = "pandas"
+
+    def __init__(self, wfp_index, price_cube, market_table):
+        self.wfp_index = wfp_index
+        self.price_cube = price_cube
+        self.market_table = market_table
+
+    def summary(self):
+        """(sorted countries, first year, last year)"""
+        return get_globals(self.wfp_index.frame)
+
+    def years(self, country):
+        """Years with data for `country`, latest first."""
+        return self.wfp_index.years(country)
+
+    def regions(self, country, year):
+        return self.wfp_index.regions(country, year)
+
+    def price_series(self, group, countries, start_year, end_year):
+        """Monthly mean standardprice per country, as country, date, avg_usdprice."""
+        # slice the precomputed monthly sums/counts instead of scanning raw rows
+        frames = []
+        for country in countries:
+            monthly = self.price_cube.get((group, country))
+            if monthly is None:
+                continue
+            monthly = monthly[monthly["year"].between(start_year, end_year)]
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "country": country,
+                        "date": monthly["date"],
+                        "avg_usdprice": (monthly["sum"] / monthly["count"]).round(3),
+                    }
+                )
+            )
+        if not frames:
+            return _empty_price_series()
+        return pd.concat(frames, ignore_index=True)
+
+    def market_prices(self, country, year):
+        """Mean standardprice per region and market location, for the map."""
+        return self.market_table.get((country, year), pd.DataFrame(columns=MAP_COLUMNS))
+
+    def prices(self, country, year, region=None):
+        """category and standardprice of every row, in the slice's order."""
+        df_slice = self.wfp_index.get(country, year, region)
+        return pd.DataFrame(
+            {
+                "category": df_slice["category"].astype(str),
+                "standardprice": df_slice["standardprice"].astype("float64").round(3),
+            }
+        )
+
+    def box_stats(self, country, year, region, max_outliers):
+        """Box statistics and outliers per category, see `box_stats`."""
+        return box_stats(self.prices(country, year, region), max_outliers)
+
+    def top_commodities(self, country, year, region=None, n=20):
+        """The `n` (category, commodity, Unit) with the highest mean standardprice."""
+        df_slice = self.wfp_index.get(country, year, region)
+        codes = [df_slice[c].cat.codes.to_numpy() for c in BAR_KEYS]
+        present = np.logical_and.reduce([c >= 0 for c in codes])
+        codes = [c[present] for c in codes]
+
+        # segment means over the slice sorted by the key codes, then a
+        # partial sort for the top n instead of a groupby and a full sort
+        order, starts = kernels.sort_segments(*codes)
+        values = df_slice["standardprice"].to_numpy(dtype="float64")[present]
+        means = kernels.segment_mean(values[order], starts)
+        top = kernels.top_k(means, n)
+        rows = order[starts[top]]
+
+        df_bar = pd.DataFrame(
+            {
+                column: df_slice[column]
+                .cat.categories.to_numpy()[code[rows]]
+                .astype(str)
+                for column, code in zip(BAR_KEYS, codes)
+            }
+        )
+        df_bar["standardprice"] = means[top].round(3)
+        return df_bar
+
+
+def _quote(path):
+    return "'" + path.replace("'", "''") + "'"
+
+
+def _hazen_quantile(values, p):
+    """SQL for the p-quantile of the sorted, non-empty list `values`.
+
+    Interpolated at p * n - 0.5 like `box_stats`; DuckDB's quantile_cont
+    interpolates at (n - 1) * p.
+    """
+    n = f"len({values})"
+    h = f"greatest(least({n} * {p} - 0.5, {n} - 1), 0)"
+    lo = f"{values}[floor({h})::BIGINT + 1]"
+    hi = f"{values}[ceil({h})::BIGINT + 1]"
+    return f"({lo} + ({h} - floor({h})) * ({hi} - {lo}))"
+
+
+class DuckDBBackend:
+    """SQL over the parquet files; the WFP rows are never loaded into memory.
+
+    The country, year and region lists are small and are read once, like the
+    SliceIndex does. Each aggregate runs as one query on its own cursor, so
+    callbacks in different threads do not serialize on the connection.
+    Results match the pandas reference to the 3 decimals the figures show;
+    the reference reads prices stored as float32.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, root=WFP_STORE, years=None, threads=None):
+        if duckdb is None:
+            raise ImportError(
+                "DATA_BACKEND=duckdb needs the duckdb package: pip install duckdb"
+            )
+        config = {"threads": int(threads)} if threads else {}
+        self._db = duckdb.connect(":memory:", config=config)
+        self._years = years
+
+        # the backend keeps reading the store version current when it was
+        # built; a reload builds a new backend for the next one
+        store = resolve_store(root)
+        if store is not None:
+            # globbing the whole store costs ~30 ms per query with ~1,000
+            # files, so queries only list the selected countries' partitions
+            self._partitions = {
+                unquote(entry.name.partition("=")[2]): entry.path
+                for entry in os.scandir(store)
+                if entry.is_dir() and entry.name.startswith("country=")
+            }
+            self._all = os.path.join(store, "**", "*.parquet")
+        else:
+            self._partitions = None
+            self._all = os.path.join(DATA_PATH, "wfp_preprocessed.parquet")
+
+        names = {
+            row[0]
+            for row in self._db.execute(f"DESCRIBE FROM {self._read()}").fetchall()
+        }
+        # the files have both `unit` and `Unit`; DuckDB names are
+        # case-insensitive, so it reads the second one as Unit_1
+        self._unit = "Unit_1" if "Unit_1" in names else "Unit"
+
+        keys = self._query(
+            f"SELECT DISTINCT country, year, admin2 FROM {self._rows()} ORDER BY ALL"
+        )
+        self.country_years = {}
+        self.country_year_regions = {}
+        for country, year, admin2 in keys.itertuples(index=False, name=None):
+            years_of_country = self.country_years.setdefault(country, [])
+            if not years_of_country or years_of_country[-1] != year:
+                years_of_country.append(int(year))
+            if admin2 is not None:
+                self.country_year_regions.setdefault((country, int(year)), set()).add(
+                    admin2
+                )
+        for years_of_country in self.country_years.values():
+            years_of_country.reverse()
+        self.country_year_regions = {
+            key: frozenset(regions)
+            for key, regions in self.country_year_regions.items()
+        }
+        logger.info("duckdb backend on %s", root)
+
+    def _read(self, countries=None):
+        """read_parquet over the files holding `countries`, or all of them."""
+        if self._partitions is None:
+            return (
+                f"(SELECT *, year(date) AS year FROM read_parquet({_quote(self._all)}, "
+                "filename = true, file_row_number = true))"
+            )
+        paths = [
+            os.path.join(self._partitions[country], "*", "*.parquet")
+            for country in countries or ()
+            if country in self._partitions
+        ]
+        # unknown countries fall back to the whole store and match no rows
+        paths = ", ".join(_quote(path) for path in paths or [self._all])
+        return (
+            f"read_parquet([{paths}], hive_partitioning = true, "
+            "filename = true, file_row_number = true)"
+        )
+
+    def _rows(self, countries=None):
+        """The columns the plots use, as a subquery over `_read(countries)`."""
+        sql = (
+            "SELECT country, year, date, admin2, latitude, longitude, category, "
+            f"commodity, {self._unit} AS Unit, standardprice, filename, "
+            f"file_row_number FROM {self._read(countries)}"
+        )
+        if self._years is not None:
+            start, end = self._years
+            sql += f" WHERE year BETWEEN {int(start)} AND {int(end)}"
+        return f"({sql})"
+
+    def _query(self, sql, params=None):
+        return self._db.cursor().execute(sql, params or []).df()
+
+    def summary(self):
+        countries = sorted(self.country_years)
+        years = [year for years in self.country_years.values() for year in years]
+        return countries, min(years), max(years)
+
+    def years(self, country):
+        return self.country_years.get(country, [])
+
+    def regions(self, country, year):
+        return self.country_year_regions.get((country, year), frozenset())
+
+    def price_series(self, group, countries, start_year, end_year):
+        if not countries:
+            return _empty_price_series()
+        where = "country IN (SELECT unnest(?)) AND year BETWEEN ? AND ?"
+        params = [list(countries), start_year, end_year]
+        if group == "Essential Commodities":
+            where += " AND commodity IN (SELECT unnest(?))"
+            params.append(ESSENTIAL_COMMODITIES)
+        return self._query(
+            f"""
+            SELECT country, date,
+                   round(sum(standardprice) / count(standardprice), 3) AS avg_usdprice
+            FROM {self._rows(countries)} WHERE {where}
+            GROUP BY country, date
+            ORDER BY country, date
+            """,
+            params,
+        )
+
+    def market_prices(self, country, year):
+        return self._query(
+            f"""
+            SELECT admin2, latitude, longitude,
+                   coalesce(round(avg(standardprice), 3), 0) AS standardprice
+            FROM {self._rows([country])}
+            WHERE country = ? AND year = ? AND admin2 IS NOT NULL
+              AND latitude IS NOT NULL AND longitude IS NOT NULL
+            GROUP BY admin2, latitude, longitude
+            ORDER BY admin2, latitude, longitude
+            """,
+            [country, year],
+        )
+
+    def _slice(self, country, region):
+        # rows in SliceIndex order: region, date, then their order in the file
+        where = "country = ? AND year = ?"
+        if region is not None:
+            where += " AND admin2 = ?"
+        return f"""
+            SELECT category, round(standardprice, 3) AS standardprice,
+                   row_number() OVER (
+                       ORDER BY admin2 NULLS LAST, date, filename, file_row_number
+                   ) AS position
+            FROM {self._rows([country])} WHERE {where}
+        """
+
+    @staticmethod
+    def _params(country, year, region):
+        return [country, year] if region is None else [country, year, region]
+
+    def prices(self, country, year, region=None):
+        return self._query(
+            f"SELECT category, standardprice FROM ({self._slice(country, region)}) "
+            "ORDER BY position",
+            self._params(country, year, region),
+        )
+
+    @staticmethod
+    def _quartiles():
+        """Quartiles per category of a `slice`, missing prices left out."""
+        return f"""
+            SELECT category, first,
+                   {_hazen_quantile("prices", 0.25)} AS q1,
+                   {_hazen_quantile("prices", 0.5)} AS median,
+                   {_hazen_quantile("prices", 0.75)} AS q3
+            FROM (
+                SELECT category, min(position) AS first,
+                       list(standardprice ORDER BY standardprice) AS prices
+                FROM slice WHERE standardprice IS NOT NULL GROUP BY category
+            )
+        """
+
+    def box_stats(self, country, year, region, max_outliers):
+        params = self._params(country, year, region)
+        # categories in order of first appearance, like the pandas groupby
+        stats = self._query(
+            f"""
+            WITH slice AS ({self._slice(country, region)}),
+            quartiles AS ({self._quartiles()})
+            SELECT q.category, q.q1, q.median, q.q3,
+                   min(s.standardprice) AS lowerfence,
+                   max(s.standardprice) AS upperfence
+            FROM quartiles q LEFT JOIN slice s
+              ON s.category = q.category
+             AND s.standardprice BETWEEN q.q1 - 1.5 * (q.q3 - q.q1)
+                                     AND q.q3 + 1.5 * (q.q3 - q.q1)
+            GROUP BY q.category, q.first, q.q1, q.median, q.q3
+            ORDER BY q.first
+            """,
+            params,
+        ).set_index("category")
+        outliers = self._query(
+            f"""
+            WITH slice AS ({self._slice(country, region)}),
+            quartiles AS ({self._quartiles()})
+            SELECT category, standardprice FROM (
+                SELECT s.category, s.standardprice,
+                       row_number() OVER (
+                           PARTITION BY s.category
+                           ORDER BY abs(s.standardprice - q.median) DESC, s.position
+                       ) AS rank
+                FROM slice s JOIN quartiles q USING (category)
+                WHERE s.standardprice NOT BETWEEN q.q1 - 1.5 * (q.q3 - q.q1)
+                                              AND q.q3 + 1.5 * (q.q3 - q.q1)
+            )
+            WHERE rank <= ?
+            ORDER BY category, rank
+            """,
+            params + [max_outliers],
+        )
+        stats.index.name = None
+        return stats, outliers
+
+    def top_commodities(self, country, year, region=None, n=20):
+        where = "country = ? AND year = ?"
+        if region is not None:
+            where += " AND admin2 = ?"
+        return self._query(
+            f"""
+            SELECT category, commodity, Unit,
+                   round(avg(standardprice), 3) AS standardprice
+            FROM {self._rows([country])}
+            WHERE {where} AND category IS NOT NULL AND commodity IS NOT NULL
+              AND Unit IS NOT NULL
+            GROUP BY category, commodity, Unit
+            ORDER BY avg(standardprice) DESC NULLS LAST, category, commodity, Unit
+            LIMIT ?
+            """,
+            self._params(country, year, region) + [n],
+        )
@@ -0,0 +1,260 @@
+import os
+import pickle
+import shutil
+import hashlib
+import tempfile
+import threading
+import functools
+from collections import OrderedDict
+
+from .encoding import compact_figure
+from .metrics import record_cache_lookup
+
+
+def normalize(value):
+    """Turn callback inputs into a hashable, order-independent cache key part.
+
+    Multi-select lists are sorted because the figures group and sort by the
+    selected values, so ["A", "B"] and ["B", "A"] render the same figure.
+    """
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = [normalize(v) for v in value]
+        try:
+            return tuple(sorted(items))
+        except TypeError:
+            return tuple(items)
+    if isinstance(value, dict):
+        return tuple(sorted((k, normalize(v)) for k, v in value.items()))
+    if hasattr(value, "item"):  # numpy scalars
+        return value.item()
+    if hasattr(value, "cache_key"):  # dataset snapshots, keyed by their version
+        return value.cache_key
+    return value
+
+
+def _rekey(key, old, new):
+    return tuple(new if part == old else part for part in key)
+
+
+def _plain(value):
+    # store plain, compact dicts: cheaper to pickle and what Dash sends anyway
+    if isinstance(value, tuple):
+        return tuple(_plain(v) for v in value)
+    if hasattr(value, "to_plotly_json"):
+        return compact_figure(value)
+    return value
+
+
+class FigureCache:
+    """Bounded memoization of figure builders, keyed on normalized inputs.
+
+    Entries live in a per-process LRU and, when `directory` is set, in a disk
+    backend that all gunicorn workers on the host share. Keys include the data
+    version, so a new version never serves figures built from older data.
+    """
+
+    def __init__(
+        self, version="", max_entries=256, directory=None, max_disk_bytes=256 * 2**20
+    ):
+        self.version = version
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    @classmethod
+    def from_env(cls, version=""):
+        return cls(
+            version=version,
+            max_entries=int(os.environ.get("FIGURE_CACHE_SIZE", 256)),
+            directory=os.environ.get("FIGURE_CACHE_DIR") or None,
+            max_disk_bytes=int(os.environ.get("FIGURE_CACHE_DISK_BYTES", 256 * 2**20)),
+        )
+
+    def memoize(self, name):
+        """Decorator caching `func(*args)` under (name, normalized args)."""
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                key = (name,) + tuple(normalize(arg) for arg in args)
+                found, value = self.get(key)
+                record_cache_lookup(found)
+                if found:
+                    return value
+                value = _plain(func(*args))
+                self.set(key, value)
+                return value
+
+            wrapper.cache = self
+            return wrapper
+
+        return decorator
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self._remember(key, value)
+                return True, value
+            self.misses += 1
+        return False, None
+
+    def set(self, key, value):
+        with self._lock:
+            # a figure whose build began before set_version holds old data
+            if self.version and self.version not in key:
+                return
+            self._remember(key, value)
+            # fixed under the lock: a version switch from here on can only
+            # send the write to the old version's directory, being removed
+            path = self._path(key) if self.directory else None
+        self._disk_set(key, value, path)
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def set_version(self, version, keep=None):
+        """Switch to a new data version, dropping every entry of the old one.
+
+        Entries matching `keep` are carried over instead, with the old version
+        in their key replaced by the new one, e.g. the figures an incremental
+        ingest did not touch.
+        """
+        with self._lock:
+            old_version, self.version = self.version, version
+            carried = OrderedDict()
+            if keep is not None:
+                for key, value in self._entries.items():
+                    if old_version in key and keep(key):
+                        carried[_rekey(key, old_version, version)] = value
+            self._entries = carried
+        if self.directory and old_version != version:
+            old_dir = self._version_dir(old_version)
+            if keep is not None:
+                for path in self._disk_files(old_dir):
+                    try:
+                        with open(path, "rb") as f:
+                            key, value = pickle.load(f)
+                    except (OSError, EOFError, pickle.UnpicklingError):
+                        continue
+                    if old_version in key and keep(key):
+                        self._disk_set(_rekey(key, old_version, version), value)
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+    def invalidate(self, predicate=None):
+        """Drop entries whose key matches `predicate` (all entries if None)."""
+        with self._lock:
+            for key in list(self._entries):
+                if predicate is None or predicate(key):
+                    del self._entries[key]
+        if self.directory:
+            version_dir = self._version_dir(self.version)
+            if predicate is None:
+                shutil.rmtree(version_dir, ignore_errors=True)
+                return
+            for path in self._disk_files(version_dir):
+                try:
+                    with open(path, "rb") as f:
+                        key, _ = pickle.load(f)
+                    if predicate(key):
+                        os.remove(path)
+                except (OSError, EOFError, pickle.UnpicklingError):
+                    continue
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "version": self.version,
+            }
+
+    # ------------------------------ disk backend ------------------------------
+
+    def _version_dir(self, version):
+        return os.path.join(self.directory, f"v-{version or 'none'}")
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self._version_dir(self.version), f"{digest}.pkl")
+
+    @staticmethod
+    def _disk_files(directory):
+        try:
+            return [e.path for e in os.scandir(directory) if e.name.endswith(".pkl")]
+        except FileNotFoundError:
+            return []
+
+    def _disk_get(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                stored_key, value = pickle.load(f)
+            os.utime(path)  # mtime doubles as the shared LRU clock
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        # guard against digest collisions
+        return value if stored_key == key else None
+
+    def _disk_set(self, key, value, path=None):
+        if not self.directory:
+            return
+        path = path or self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, so other workers never read a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        self._writes += 1
+        if self._writes % 32 == 0:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        for path in self._disk_files(self._version_dir(self.version)):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
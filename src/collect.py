@@ -0,0 +1,372 @@
+"""Download the per-country WFP food price CSVs listed in wfp_countries_global.csv.
+
+    python -m src.collect                              # refresh data/raw/wfp
+    python -m src.collect --concurrency 16 --combine data/raw/wfp_dataset.parquet
+    python -m src.collect --base-url http://127.0.0.1:8000   # local stand-in
+
+Replaces reports/1_collect_datasets.ipynb. Each country's HDX dataset page is
+scraped for its download link, then the CSV is fetched with:
+
+- bounded parallelism (`--concurrency` requests in flight),
+- retries with exponential backoff on connection errors, 429 and 5xx,
+- conditional requests from the ETag/Last-Modified stored in the manifest,
+  so unchanged files cost one 304,
+- resumable output: bytes land in `<file>.part` and an interrupted download
+  continues with a Range request,
+- a sha256 per file in `manifest.json`; files that no longer match their
+  checksum are fetched again.
+
+The manifest keeps every download link as found on HDX; `--base-url` is
+applied to it on every run, and a link that has gone (404/410) is scraped
+again from the dataset page.
+"""
+
+import os
+import csv
+import json
+import random
+import asyncio
+import hashlib
+import logging
+import argparse
+import http.client
+import urllib.error
+import urllib.parse
+import urllib.request
+from html.parser import HTMLParser
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RAW_PATH = os.path.join(BASE_DIR, "..", "data", "raw")
+COUNTRIES_CSV = os.path.join(RAW_PATH, "wfp_countries_global.csv")
+OUTPUT_DIR = os.path.join(RAW_PATH, "wfp")
+MANIFEST = "manifest.json"
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# a stored download link answering these is scraped again
+GONE_STATUS = {404, 410}
+CHUNK_SIZE = 1 << 16
+USER_AGENT = "food-security-collector/1.0"
+
+
+class DownloadError(Exception):
+    pass
+
+
+class _DownloadLinkParser(HTMLParser):
+    """First <a class="resource-download-button" href=...> on an HDX dataset page."""
+
+    def __init__(self):
+        super().__init__()
+        self.href = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a" or self.href is not None:
+            return
+        attrs = dict(attrs)
+        if "resource-download-button" in (attrs.get("class") or "").split():
+            self.href = attrs.get("href")
+
+
+def read_countries(path=COUNTRIES_CSV):
+    """(iso3, dataset page url) for every row with a url, skipping the HXL tag row."""
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    return [
+        (row["countryiso3"].strip(), row["url"].strip())
+        for row in rows
+        if row["url"].strip() and not row["countryiso3"].startswith("#")
+    ]
+
+
+def rebase(url, base_url):
+    """Point `url` at `base_url` (scheme and host), keeping its path and query."""
+    if not base_url:
+        return url
+    base = urllib.parse.urlsplit(base_url)
+    parts = urllib.parse.urlsplit(url)
+    return urllib.parse.urlunsplit(
+        (base.scheme, base.netloc, base.path.rstrip("/") + parts.path, parts.query, "")
+    )
+
+
+def sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+class Collector:
+    def __init__(
+        self,
+        output_dir=OUTPUT_DIR,
+        concurrency=8,
+        retries=4,
+        backoff=1.0,
+        timeout=60,
+        base_url=None,
+    ):
+        self.output_dir = output_dir
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.base_url = base_url
+        self.manifest = load_manifest(output_dir)
+
+    # ------------------------------ blocking I/O ------------------------------
+
+    def _open(self, url, headers=None):
+        request = urllib.request.Request(
+            url, headers={"User-Agent": USER_AGENT, **(headers or {})}
+        )
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code in (304, 416):
+                return e  # handled by the caller, not errors
+            raise
+
+    def _find_download_url(self, page_url):
+        """Download link on the dataset page, resolved against the real page url."""
+        with self._open(rebase(page_url, self.base_url)) as r:
+            parser = _DownloadLinkParser()
+            parser.feed(r.read().decode("utf-8", errors="replace"))
+        if not parser.href:
+            raise DownloadError(f"no download link on {page_url}")
+        return urllib.parse.urljoin(page_url, parser.href)
+
+    def _download(self, url, path, entry):
+        """Fetch `url` into `path`; returns the new manifest entry, or None if unchanged.
+
+        `url` is the link as stored in the manifest; the request goes to
+        `base_url` when one is set.
+        """
+        part = f"{path}.part"
+        headers = {}
+        have_file = os.path.exists(path) and entry.get("sha256")
+        if have_file:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            # only resume onto the same version of the file
+            validator = entry.get("part_etag") or entry.get("part_last_modified")
+            if validator:
+                headers["If-Range"] = validator
+
+        with self._open(rebase(url, self.base_url), headers) as r:
+            status = r.status
+            if status == 304:
+                return None
+            if status == 416:
+                # the .part already holds the whole file
+                os.replace(part, path)
+                return self._entry(
+                    url, path, entry.get("part_etag"), entry.get("part_last_modified")
+                )
+            if status != 206:
+                offset = 0  # server ignored the Range (or the file changed)
+
+            # remember the validators so an interrupted run can resume safely
+            entry["part_etag"] = r.headers.get("ETag")
+            entry["part_last_modified"] = r.headers.get("Last-Modified")
+            received = 0
+            with open(part, "ab" if offset else "wb") as f:
+                for chunk in iter(lambda: r.read(CHUNK_SIZE), b""):
+                    f.write(chunk)
+                    received += len(chunk)
+            # urllib returns a body cut short by the server without complaint;
+            # raising keeps the .part, and the retry resumes it
+            expected = r.headers.get("Content-Length")
+            if expected is not None and received < int(expected):
+                raise http.client.IncompleteRead(b"", int(expected) - received)
+
+        os.replace(part, path)
+        return self._entry(
+            url, path, r.headers.get("ETag"), r.headers.get("Last-Modified")
+        )
+
+    @staticmethod
+    def _entry(url, path, etag, last_modified):
+        return {
+            "url": url,
+            "file": os.path.basename(path),
+            "etag": etag,
+            "last_modified": last_modified,
+            "size": os.path.getsize(path),
+            "sha256": sha256(path),
+        }
+
+    # ------------------------------- scheduling -------------------------------
+
+    async def _retry(self, func, *args):
+        for attempt in range(self.retries + 1):
+            try:
+                return await asyncio.to_thread(func, *args)
+            except (urllib.error.URLError, OSError, http.client.IncompleteRead) as e:
+                code = getattr(e, "code", None)
+                if code is not None and code not in RETRY_STATUS:
+                    raise
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2**attempt * (1 + random.random())
+                retry_after = getattr(e, "headers", None) and e.headers.get(
+                    "Retry-After"
+                )
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, int(retry_after))
+                logger.warning(
+                    "%s (attempt %d), retrying in %.1fs", e, attempt + 1, delay
+                )
+                await asyncio.sleep(delay)
+
+    async def _resolve(self, entry, iso3, page_url):
+        """Scrape the current download link into `entry`; returns the file path."""
+        url = await self._retry(self._find_download_url, page_url)
+        name = os.path.basename(urllib.parse.urlsplit(url).path)
+        entry.update(url=url, file=name or f"{iso3}.csv")
+        return os.path.join(self.output_dir, entry["file"])
+
+    async def _collect_one(self, semaphore, iso3, page_url):
+        async with semaphore:
+            entry = dict(self.manifest.get(iso3, {}))
+            path = os.path.join(self.output_dir, entry.get("file") or f"{iso3}.csv")
+
+            # a file that no longer matches its checksum is fetched unconditionally
+            if os.path.exists(path) and entry.get("sha256"):
+                if await asyncio.to_thread(sha256, path) != entry["sha256"]:
+                    logger.warning("%s: checksum mismatch, downloading again", iso3)
+                    entry.pop("sha256")
+
+            scraped = not entry.get("url")
+            if scraped:
+                path = await self._resolve(entry, iso3, page_url)
+
+            try:
+                try:
+                    new_entry = await self._retry(
+                        self._download, entry["url"], path, entry
+                    )
+                except urllib.error.HTTPError as e:
+                    if scraped or e.code not in GONE_STATUS:
+                        raise
+                    # the dataset page links to a new resource by now
+                    logger.info(
+                        "%s: %s gone (%d), scraping again", iso3, entry["url"], e.code
+                    )
+                    path = await self._resolve(entry, iso3, page_url)
+                    new_entry = await self._retry(
+                        self._download, entry["url"], path, entry
+                    )
+            except BaseException:
+                # keep the link and the .part validators for the next run
+                self.manifest[iso3] = entry
+                raise
+            if new_entry is None:
+                return iso3, "unchanged"
+            self.manifest[iso3] = new_entry
+            return iso3, "downloaded"
+
+    async def run(self, countries):
+        """Collect every (iso3, page url); returns {iso3: status}."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [self._collect_one(semaphore, iso3, url) for iso3, url in countries]
+
+        results = {}
+        try:
+            for done in asyncio.as_completed(tasks):
+                try:
+                    iso3, status = await done
+                except Exception as e:
+                    logger.error("download failed: %s", e)
+                    continue
+                results[iso3] = status
+                logger.info("%s: %s", iso3, status)
+        finally:
+            # checksums and validators survive an interrupted run
+            save_manifest(self.output_dir, self.manifest)
+
+        for iso3, _ in countries:
+            results.setdefault(iso3, "failed")
+        return results
+
+
+def combine(output_dir, manifest=None):
+    """Concatenate the collected CSVs into one frame, as notebook 1 did."""
+    import pandas as pd
+
+    manifest = manifest if manifest is not None else load_manifest(output_dir)
+    frames = []
+    for iso3, entry in sorted(manifest.items()):
+        # the second row of every HDX CSV holds HXL tags
+        df = pd.read_csv(os.path.join(output_dir, entry["file"]), skiprows=[1])
+        df["country"] = iso3
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True)
+    df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d", errors="coerce")
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Download the WFP country price CSVs listed in wfp_countries_global.csv"
+    )
+    parser.add_argument("--countries", default=COUNTRIES_CSV)
+    parser.add_argument("--dst", default=OUTPUT_DIR)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument(
+        "--base-url", help="fetch from this host instead, e.g. a local stand-in"
+    )
+    parser.add_argument("--combine", help="also write all CSVs as one parquet file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    collector = Collector(
+        args.dst,
+        concurrency=args.concurrency,
+        retries=args.retries,
+        timeout=args.timeout,
+        base_url=args.base_url,
+    )
+    results = asyncio.run(collector.run(read_countries(args.countries)))
+
+    counts = {}
+    for status in results.values():
+        counts[status] = counts.get(status, 0) + 1
+    print(", ".join(f"{n} {status}" for status, n in sorted(counts.items())))
+
+    if args.combine:
+        df = combine(args.dst, collector.manifest)
+        df.to_parquet(args.combine)
+        print(f"Wrote {len(df)} rows to {args.combine}")
+    return 1 if counts.get("failed") else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
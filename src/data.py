@@ -1,5 +1,13 @@
 import os
+import hashlib
+import logging
+import argparse
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
+
+from . import kernels
+from .store import read_wfp_store, resolve_store
 
 # Define constants
 ESSENTIAL_COMMODITIES = [
@@ -16,16 +24,235 @@ ESSENTIAL_COMMODITIES = [
 ]
 
 
-def load_data():
+# string columns of the WFP frame that are stored as categorical codes
+CATEGORICAL_COLUMNS = [
+    "country",
+    "countryiso3",
+    "admin1",
+    "admin2",
+    "market",
+    "category",
+    "commodity",
+    "unit",
+    "Unit",
+    "currency",
+    "priceflag",
+    "pricetype",
+]
+
+# price columns downcast to float32 when the round trip stays below display precision
+FLOAT32_COLUMNS = ["price", "usdprice", "standardprice", "Value"]
+FLOAT32_TOLERANCE = 5e-4  # prices are shown rounded to 3 decimals
 
-    # load data
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    DATA_PATH = os.path.join(BASE_DIR, "..", "data", "processed")
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(BASE_DIR, "..", "data", "processed")
+WFP_STORE = os.path.join(DATA_PATH, "wfp_store")
+
+
+def load_wfp(countries=None, years=None, columns=None):
+    """Load WFP rows, reading only the country/year partitions requested.
+
+    Falls back to the flat `wfp_preprocessed.parquet` when the partitioned
+    store has not been built (see `python -m src.store`).
+    """
+    store = resolve_store(WFP_STORE)
+    if store is not None:
+        return read_wfp_store(store, countries=countries, years=years, columns=columns)
+
+    filters = [("country", "in", list(countries))] if countries is not None else None
+    wfp = pd.read_parquet(
+        f"{DATA_PATH}/wfp_preprocessed.parquet", columns=columns, filters=filters
+    )
+    if years is not None:
+        wfp = wfp[wfp["date"].dt.year.between(*years)].reset_index(drop=True)
+    return wfp
+
+
+def data_version():
+    """Short fingerprint of the input files, used to tag cached figures."""
+    paths = [
+        f"{DATA_PATH}/FAOSTAT_data_en_nutrition.csv",
+        f"{DATA_PATH}/affordability_index.csv",
+    ]
+    # files of the current store version, named as if under WFP_STORE so the
+    # fingerprint does not change with the version directory alone
+    store = resolve_store(WFP_STORE)
+    names = {}
+    if store is not None:
+        for root, _, files in os.walk(store):
+            for name in files:
+                path = os.path.join(root, name)
+                names[path] = os.path.join(WFP_STORE, os.path.relpath(path, store))
+    else:
+        paths.append(f"{DATA_PATH}/wfp_preprocessed.parquet")
+
+    digest = hashlib.sha1()
+    for path in sorted([*paths, *names], key=lambda path: names.get(path, path)):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        name = os.path.relpath(names.get(path, path), DATA_PATH)
+        digest.update(f"{name}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return digest.hexdigest()[:12]
 
-    wfp = pd.read_parquet(f"{DATA_PATH}/wfp_preprocessed.parquet")
+
+def wfp_years_from_env():
+    # e.g. WFP_YEARS=2014-2024 to serve a slice of a full-history store
+    value = os.environ.get("WFP_YEARS")
+    if not value:
+        return None
+    start, end = value.split("-")
+    return int(start), int(end)
+
+
+def load_data(countries=None, years=None):
+
+    # load data
+    wfp_raw = load_wfp(countries=countries, years=years)
     fao = pd.read_csv(f"{DATA_PATH}/FAOSTAT_data_en_nutrition.csv")
-    aff_index = pd.read_csv("{DATA_PATH}/affordability_index.csv")
+    aff_index = pd.read_csv(f"{DATA_PATH}/affordability_index.csv")
+    return prepare_data(wfp_raw, fao, aff_index)
+
+
+def prepare_data(wfp_raw, fao, aff_index):
+    """Build every table the dashboard serves from the raw input frames."""
+    wfp, markets = compact_wfp(wfp_raw)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "WFP memory by column (bytes):\n%s", memory_report(wfp_raw, wfp, markets)
+        )
+    del wfp_raw
+    wfp_index = SliceIndex(wfp)
+    wfp = wfp_index.frame
+
+    fao, fao_grouped = prepare_fao(fao)
+    commodity_country_set = build_commodity_country_set(wfp)
+    price_cube = build_price_cube(wfp, ESSENTIAL_COMMODITIES)
+    market_table = build_market_table(wfp, markets)
+    return (
+        wfp,
+        fao,
+        fao_grouped,
+        aff_index,
+        commodity_country_set,
+        wfp_index,
+        markets,
+        price_cube,
+        market_table,
+    )
+
+
+def refresh_data(tables, changed, years=None):
+    """The `prepare_data` tuple of `tables` with the `changed` keys reloaded.
+
+    `changed` holds the (country, year) keys an ingest rewrote. Only their
+    partitions are read from the store; the rows of every other key, the
+    price series of the other countries and the map aggregates of the other
+    keys are kept from `tables`. The summary tables are read again in full.
+    """
+    old_wfp, _, _, _, _, _, old_markets, price_cube, market_table = tables
+    if years is not None:
+        changed = {(c, y) for c, y in changed if years[0] <= y <= years[1]}
+    if not changed:
+        return (tables[0], *load_summary_data(), *tables[4:])
+    countries = sorted({country for country, _ in changed})
+    keys = pd.MultiIndex.from_tuples(sorted(changed), names=["country", "year"])
 
+    span = (min(y for _, y in changed), max(y for _, y in changed))
+    new_raw = load_wfp(countries=countries, years=span)
+    new_raw = new_raw[
+        pd.MultiIndex.from_arrays([new_raw["country"], new_raw["date"].dt.year]).isin(
+            keys
+        )
+    ]
+    new_wfp, new_markets = compact_wfp(new_raw)
+    new_wfp, markets = _merge_markets(old_markets, new_wfp, new_markets)
+
+    kept = ~pd.MultiIndex.from_arrays(
+        [old_wfp["country"].astype(str), old_wfp["year"].astype(int)]
+    ).isin(keys)
+    wfp = _concat_compact([old_wfp[kept], new_wfp[old_wfp.columns]])
+    _downcast_prices(wfp)
+    wfp_index = SliceIndex(wfp)
+    wfp = wfp_index.frame
+
+    # a country's price series spans all its years, so changed countries are
+    # rebuilt whole; the map aggregates are per key
+    cube = build_price_cube(wfp[wfp["country"].isin(countries)], ESSENTIAL_COMMODITIES)
+    price_cube = {
+        **{key: price_cube[key] for key in price_cube if key[1] not in countries},
+        **cube,
+    }
+    rows = pd.MultiIndex.from_arrays(
+        [wfp["country"].astype(str), wfp["year"].astype(int)]
+    ).isin(keys)
+    table = build_market_table(wfp[rows], markets)
+    market_table = {
+        **{key: market_table[key] for key in market_table if key not in changed},
+        **table,
+    }
+
+    fao, fao_grouped, aff_index = load_summary_data()
+    return (
+        wfp,
+        fao,
+        fao_grouped,
+        aff_index,
+        build_commodity_country_set(wfp),
+        wfp_index,
+        markets,
+        price_cube,
+        market_table,
+    )
+
+
+def _concat_compact(frames, ignore_index=True):
+    """pd.concat of compact frames that keeps their categoricals categorical."""
+    df = pd.concat(frames, ignore_index=ignore_index)
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            df[col] = union_categoricals(
+                [frame[col] for frame in frames], sort_categories=True
+            )
+    return df
+
+
+def _merge_markets(markets, wfp, new_markets):
+    """Renumber the markets of `wfp` into `markets`, adding the new ones."""
+    market_keys = ["country", "admin2", "market", "latitude", "longitude"]
+    known = (
+        new_markets[market_keys]
+        .astype({col: object for col in market_keys[:3]})
+        .reset_index()
+        .merge(
+            markets[market_keys]
+            .astype({col: object for col in market_keys[:3]})
+            .reset_index(),
+            on=market_keys,
+            how="left",
+            suffixes=("", "_known"),
+        )
+        .set_index("market_id")["market_id_known"]
+    )
+    unknown = known.index[known.isna()]
+    ids = known.copy()
+    ids[unknown] = np.arange(len(unknown)) + (
+        markets.index.max() + 1 if len(markets) else 0
+    )
+    ids = ids.astype("int32")
+
+    added = new_markets.loc[unknown].set_axis(ids[unknown].to_numpy())
+    added.index.name = markets.index.name
+    markets = _concat_compact([markets, added], ignore_index=False)
+    wfp = wfp.assign(market_id=ids.reindex(wfp["market_id"]).to_numpy())
+    return wfp, markets
+
+
+def prepare_fao(fao):
+    """Parse the FAO undernourishment values and average them per year and area."""
     # preprocess
     fao["Value"] = (
         fao["Value"].astype(str).str.replace("<", "", regex=False).astype(float)
@@ -35,26 +262,368 @@ def load_data():
     # group
     fao_grouped = fao.groupby(["Year", "Area"], as_index=False)["Value"].mean()
     fao_grouped["Value"] = fao_grouped["Value"].fillna(0)
+    return fao, fao_grouped
+
+
+def load_summary_data():
+    """The FAO and affordability tables, without the WFP rows."""
+    fao = pd.read_csv(f"{DATA_PATH}/FAOSTAT_data_en_nutrition.csv")
+    aff_index = pd.read_csv(f"{DATA_PATH}/affordability_index.csv")
+    fao, fao_grouped = prepare_fao(fao)
+    return fao, fao_grouped, aff_index
+
+
+def build_commodity_country_set(wfp):
+    """The set of countries reporting each commodity, one row per commodity.
+
+    Works on the category codes: the distinct (commodity, country) pairs are
+    found with one np.unique over the rows instead of hashing every row's
+    country name into a per-commodity Python set.
+    """
+    commodity = wfp["commodity"].cat.codes.to_numpy().astype(np.int64)
+    country = wfp["country"].cat.codes.to_numpy().astype(np.int64)
+    n_countries = len(wfp["country"].cat.categories)
+    present = (commodity >= 0) & (country >= 0)
+    pairs = np.unique(commodity[present] * n_countries + country[present])
+    commodity_codes, country_codes = np.divmod(pairs, n_countries)
+
+    starts = np.flatnonzero(np.diff(commodity_codes, prepend=-1))
+    names = wfp["country"].cat.categories.to_numpy()[country_codes]
+    countries = [set(group) for group in np.split(names, starts[1:])]
+    commodities = pd.Categorical.from_codes(
+        commodity_codes[starts], dtype=wfp["commodity"].dtype
+    )
+    return pd.DataFrame({"commodity": commodities, "countries": countries})
+
+
+def build_price_cube(wfp, essential_commodities):
+    """Monthly standardprice sum and count per commodity group and country.
+
+    Keys are (commodity_group, country) with commodity_group one of
+    "All Commodities" or "Essential Commodities"; values are small frames of
+    date, year, sum and count, so any selection's monthly mean is exact.
+    The sums are segment reductions over the rows sorted by (country, date)
+    codes, see `src.kernels`.
+    """
+    countries = wfp["country"].cat.codes.to_numpy().astype(np.int64)
+    names = wfp["country"].cat.categories
+    # one int64 key per row: the country code, then the month's sorted position
+    date_codes, months = pd.factorize(wfp["date"], sort=True)
+    keys = countries * len(months) + date_codes
+    present = (countries >= 0) & (date_codes >= 0)
+    # accumulate in float64 even when the prices are stored as float32
+    prices = wfp["standardprice"].to_numpy(dtype="float64")
+    groups = {
+        "All Commodities": present,
+        "Essential Commodities": present
+        & wfp["commodity"].isin(essential_commodities).to_numpy(),
+    }
+    month_years = months.year.to_numpy().astype("int16")
+
+    price_cube = {}
+    for group, rows in groups.items():
+        order, starts = kernels.sort_segments(keys[rows])
+        values = prices[rows][order]
+        sums = kernels.segment_sum(values, starts)
+        counts = kernels.segment_count(values, starts)
+        month_country, month = np.divmod(keys[rows][order][starts], len(months))
 
-    commodity_country_set = (
-        wfp.groupby("commodity")["country"]
-        .agg(lambda x: set(x))
-        .reset_index(name="countries")
+        # the (country, date) groups are sorted, so each country is one run
+        bounds = np.flatnonzero(np.diff(month_country, prepend=-1))
+        for start, stop in zip(bounds, np.append(bounds[1:], len(month))):
+            price_cube[(group, names[month_country[start]])] = pd.DataFrame(
+                {
+                    "date": months[month[start:stop]],
+                    "year": month_years[month[start:stop]],
+                    "sum": sums[start:stop],
+                    "count": counts[start:stop],
+                },
+                copy=False,
+            )
+    return price_cube
+
+
+def compact_wfp(wfp):
+    """Return a compact copy of the WFP frame and its market coordinates table.
+
+    Strings become categoricals, `year` is an int16 column, prices are
+    float32 where that loses nothing at display precision, and latitude /
+    longitude move to a `markets` table referenced by an int32 `market_id`.
+    """
+    wfp = wfp.copy()
+
+    if "year" not in wfp.columns:
+        wfp["year"] = wfp["date"].dt.year
+    wfp["year"] = wfp["year"].astype("int16")
+
+    for col in CATEGORICAL_COLUMNS:
+        if col in wfp.columns:
+            wfp[col] = wfp[col].astype("category")
+
+    _downcast_prices(wfp)
+
+    # coordinates are stored once per market instead of once per price row
+    market_keys = ["country", "admin2", "market", "latitude", "longitude"]
+    market_ids = wfp.groupby(
+        market_keys, sort=True, dropna=False, observed=True
+    ).ngroup()
+    wfp["market_id"] = market_ids.astype("int32")
+    markets = (
+        wfp[market_keys + ["market_id"]]
+        .drop_duplicates("market_id")
+        .set_index("market_id")
+        .sort_index()
+    )
+    markets["latitude"] = markets["latitude"].astype("float64")
+    markets["longitude"] = markets["longitude"].astype("float64")
+    wfp = wfp.drop(columns=["latitude", "longitude"])
+
+    return wfp, markets
+
+
+def _downcast_prices(wfp):
+    # in place: float32 where the round trip stays below display precision
+    for col in FLOAT32_COLUMNS:
+        if col not in wfp.columns:
+            continue
+        values = wfp[col].to_numpy(dtype="float64")
+        downcast = values.astype("float32")
+        error = np.abs(downcast.astype("float64") - values)
+        if np.all(np.isnan(values) | (error < FLOAT32_TOLERANCE)):
+            wfp[col] = downcast
+
+
+def memory_report(before, after, markets=None):
+    """Bytes per column of the WFP frame before and after `compact_wfp`."""
+    report = pd.DataFrame(
+        {
+            "before": before.memory_usage(index=False, deep=True),
+            "after": after.memory_usage(index=False, deep=True),
+        }
     )
-    return wfp, fao, fao_grouped, aff_index, commodity_country_set
+    if markets is not None:
+        # latitude/longitude now live in the markets table
+        for col in ["latitude", "longitude"]:
+            report.loc[col, "after"] = markets[col].memory_usage(index=False, deep=True)
+    report = report.fillna(0).astype("int64")
+    report.loc["total"] = report.sum()
+    return report
+
+
+def build_market_table(wfp, markets):
+    """Mean standardprice per (country, year, admin2, latitude, longitude).
+
+    Returned as a dict keyed by (country, year) so the map only looks up the
+    selected country-year instead of grouping the country's whole history.
+    """
+    df = with_coordinates(
+        wfp[["country", "year", "admin2", "market_id", "standardprice"]], markets
+    )
+    df["standardprice"] = df["standardprice"].astype("float64")
+    grouped = (
+        df.groupby(
+            ["country", "year", "admin2", "latitude", "longitude"], observed=True
+        )["standardprice"]
+        .mean()
+        .reset_index()
+    )
+    grouped["admin2"] = grouped["admin2"].astype(str)
+    grouped["standardprice"] = grouped["standardprice"].round(3).fillna(0)
+
+    columns = ["admin2", "latitude", "longitude", "standardprice"]
+    return {
+        (country, int(year)): frame[columns].reset_index(drop=True)
+        for (country, year), frame in grouped.groupby(
+            ["country", "year"], observed=True, sort=False
+        )
+    }
+
+
+def with_coordinates(df, markets):
+    # attach latitude/longitude from the markets table via market_id
+    return df.join(markets[["latitude", "longitude"]], on="market_id")
+
+
+def _row_ranges(df, keys):
+    # df must already be sorted by `keys`, so every group is one contiguous run
+    ids = df.groupby(keys, sort=False, dropna=False, observed=True).ngroup().to_numpy()
+    starts = np.flatnonzero(np.diff(ids, prepend=-1))
+    stops = np.append(starts[1:], len(ids))
+    first = df[keys].iloc[starts]
+    return {
+        key: (start, stop)
+        for key, start, stop in zip(
+            first.itertuples(index=False, name=None), starts.tolist(), stops.tolist()
+        )
+    }
+
+
+class SliceIndex:
+    """Precomputed row ranges of the WFP frame for the Country tab.
+
+    The frame is sorted once by (country, year, admin2, date) so that every
+    (country, year) and (country, year, admin2) slice is a contiguous block
+    and can be returned with `iloc` instead of a boolean scan.
+    """
+
+    def __init__(self, wfp, presorted=False):
+        # presorted frames (e.g. mapped from a snapshot) are used as they are
+        self.frame = (
+            wfp
+            if presorted
+            else wfp.sort_values(
+                ["country", "year", "admin2", "date"], kind="stable", ignore_index=True
+            )
+        )
+
+        self.year_ranges = _row_ranges(self.frame, ["country", "year"])
+        self.region_ranges = _row_ranges(self.frame, ["country", "year", "admin2"])
+
+        self.country_years = {}
+        for country, year in self.year_ranges:
+            self.country_years.setdefault(country, []).append(int(year))
+        for years in self.country_years.values():
+            years.sort(reverse=True)
+
+        self.country_year_regions = {}
+        for country, year, admin2 in self.region_ranges:
+            self.country_year_regions.setdefault((country, year), set()).add(admin2)
+        self.country_year_regions = {
+            key: frozenset(regions)
+            for key, regions in self.country_year_regions.items()
+        }
+
+    def get(self, country, year, region=None):
+        if region is None:
+            rows = self.year_ranges.get((country, year))
+        else:
+            rows = self.region_ranges.get((country, year, region))
+        if rows is None:
+            return self.frame.iloc[0:0]
+        return self.frame.iloc[rows[0] : rows[1]]
+
+    def years(self, country):
+        return self.country_years.get(country, [])
+
+    def regions(self, country, year):
+        return self.country_year_regions.get((country, year), frozenset())
 
 
 def get_globals(wfp):
     all_countries = sorted(wfp["country"].unique())
-    min_year = wfp["date"].dt.year.min()
-    max_year = wfp["date"].dt.year.max()
+    min_year = int(wfp["year"].min())
+    max_year = int(wfp["year"].max())
 
     return all_countries, min_year, max_year
 
 
-def get_years(df, country):
-    return sorted(df[df["country"] == country]["date"].dt.year.unique(), reverse=True)
+def get_years(wfp_index, country):
+    return wfp_index.years(country)
+
+
+def _signed_pct(value):
+    return f"+{value:.2f}%" if value > 0 else f"{value:.2f}%"
+
+
+def build_aff_panel(aff_index, nbins=30):
+    """Precompute everything the affordability widgets display.
+
+    Returns a JSON-serializable dict, keyed by year (as a string) for the
+    Global summary cards and histogram and by "country|year" for the Country
+    info card (as [index text, YoY text, YoY color class]), so clientside
+    callbacks only need a lookup.
+    """
+    df = aff_index[["country", "year", "affordability_index", "affordability_ratio"]]
+
+    # per-year summary statistics and changes against the previous year
+    by_year = df.groupby("year")["affordability_index"]
+    yearly = pd.DataFrame({"mean_index": by_year.mean(), "total": by_year.size()})
+    under = df["affordability_index"] < by_year.transform("mean")
+    yearly["pct_under"] = under.groupby(df["year"]).sum() / yearly["total"] * 100
+
+    summary = {}
+    for year, row in yearly.iterrows():
+        entry = {
+            "avg_text": f"{row['mean_index']:.2f}",
+            "pct_text": f"{row['pct_under']:.1f}%",
+            "avg_change_text": "",
+            "pct_change_text": "",
+            "avg_change_style": {},
+            "pct_change_style": {},
+        }
+        if year - 1 in yearly.index:
+            prev = yearly.loc[year - 1]
+            avg_change = (
+                (row["mean_index"] - prev["mean_index"]) / prev["mean_index"] * 100
+            )
+            pct_change = row["pct_under"] - prev["pct_under"]
+            entry["avg_change_text"] = _signed_pct(avg_change)
+            entry["pct_change_text"] = _signed_pct(pct_change)
+            entry["avg_change_style"] = {"color": "green" if avg_change >= 0 else "red"}
+            entry["pct_change_style"] = {"color": "green" if pct_change >= 0 else "red"}
+        summary[str(year)] = entry
+
+    # per (country, year) index and YoY growth
+    current = df.set_index(["country", "year"])["affordability_index"]
+    current = current[~current.index.duplicated()]
+    previous = current.reindex(
+        pd.MultiIndex.from_arrays(
+            [current.index.get_level_values(0), current.index.get_level_values(1) - 1]
+        )
+    ).to_numpy()
+
+    countries = {}
+    for (country, year), value, prev in zip(
+        current.index, current.to_numpy(), previous
+    ):
+        if not np.isnan(prev) and prev != 0:
+            yoy_growth = (value - prev) / prev * 100
+            yoy_text = f"YoY Growth: {yoy_growth:.2f}%"
+            yoy_color = (
+                "text-success"
+                if yoy_growth > 0
+                else "text-danger" if yoy_growth < 0 else "text-muted"
+            )
+        else:
+            yoy_text = "YoY Growth: N/A"
+            yoy_color = "text-muted"
+        countries[f"{country}|{year}"] = [f"{value:.2f}", yoy_text, yoy_color]
+
+    # histogram bin counts of the affordability ratio per year
+    hist = {}
+    for year, ratios in df.groupby("year")["affordability_ratio"]:
+        counts, edges = np.histogram(ratios.dropna(), bins=nbins)
+        hist[str(year)] = {
+            "x": ((edges[:-1] + edges[1:]) / 2).round(4).tolist(),
+            "y": counts.tolist(),
+        }
+
+    return {"summary": summary, "countries": countries, "hist": hist}
 
 
 def get_aff_years(df):
     return sorted(df["year"].unique(), reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the prepared WFP tables")
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="print the WFP frame's bytes per column before and after compaction",
+    )
+    args = parser.parse_args()
+    if not args.memory:
+        parser.error("nothing to do, pass --memory")
+
+    # the rows the dashboard would load, WFP_YEARS included
+    wfp_raw = load_wfp(years=wfp_years_from_env())
+    wfp, markets = compact_wfp(wfp_raw)
+    report = memory_report(wfp_raw, wfp, markets)
+    print(report.to_string())
+    before, after = report.loc["total"]
+    print(f"{len(wfp_raw)} rows, {after / before:.0%} of the original size")
+
+
+if __name__ == "__main__":
+    main()
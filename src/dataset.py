@@ -0,0 +1,237 @@
+import os
+import gc
+import functools
+import time
+import logging
+import threading
+
+import flask
+
+from .data import (
+    WFP_STORE,
+    data_version,
+    load_data,
+    load_summary_data,
+    refresh_data,
+    get_aff_years,
+    build_aff_panel,
+)
+from .backend import BACKEND, DuckDBBackend, PandasBackend
+from .plots import get_hist_figures
+from .snapshot import load_artifact, load_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def build_aff_store(aff_index):
+    """The affordability panel and histogram figures the page keeps in a Store."""
+    aff_panel = build_aff_panel(aff_index)
+    return {**aff_panel, "hist": get_hist_figures(aff_panel)}
+
+
+class Dataset:
+    """One immutable snapshot of every table the dashboard serves.
+
+    Callbacks take the current snapshot once per request and use only that,
+    so a swap never mixes tables of two versions within one response.
+    The WFP plots read through `backend`; with a DuckDB backend the WFP
+    tables are None and the rows stay on disk.
+    """
+
+    def __init__(self, version, tables, aff_store=None, backend=None):
+        (
+            self.wfp,
+            self.fao,
+            self.fao_grouped,
+            self.aff_index,
+            self.commodity_country_set,
+            self.wfp_index,
+            self.markets,
+            self.price_cube,
+            self.market_table,
+        ) = tables
+        self.version = version
+        self.backend = backend or PandasBackend(
+            self.wfp_index, self.price_cube, self.market_table
+        )
+
+        self.all_countries, self.min_year, self.max_year = self.backend.summary()
+        self.default_country = self.all_countries[0]
+        self.default_year = self.backend.years(self.default_country)[0]
+
+        # list of years in descending order; doesn't match wfp years
+        self.aff_years = get_aff_years(self.aff_index)
+        # stored with the snapshot when there is one: building the histogram
+        # figures was the slowest step of a cold start
+        self.aff_store = aff_store or build_aff_store(self.aff_index)
+
+    @property
+    def tables(self):
+        """The `prepare_data` tuple this snapshot was built from."""
+        return (
+            self.wfp,
+            self.fao,
+            self.fao_grouped,
+            self.aff_index,
+            self.commodity_country_set,
+            self.wfp_index,
+            self.markets,
+            self.price_cube,
+            self.market_table,
+        )
+
+    @property
+    def cache_key(self):
+        # memoized figures are keyed by the version, not the tables
+        return self.version
+
+
+def load_dataset(years=None, previous=None, changed=None):
+    """Load the current data version.
+
+    Given the `previous` Dataset and the (country, year) keys `changed`
+    since, only those keys are read and recomputed, see `refresh_data`.
+    """
+    version = data_version()
+    if BACKEND == "duckdb":
+        fao, fao_grouped, aff_index = load_summary_data()
+        tables = (None, fao, fao_grouped, aff_index, None, None, None, None, None)
+        backend = DuckDBBackend(
+            WFP_STORE, years=years, threads=os.environ.get("DUCKDB_THREADS")
+        )
+        return Dataset(version, tables, backend=backend)
+    if previous is not None and previous.wfp is not None and changed is not None:
+        build = functools.partial(refresh_data, previous.tables, changed, years=years)
+    else:
+        build = functools.partial(load_data, years=years)
+    if os.environ.get("WFP_SNAPSHOT", "1") == "0":
+        return Dataset(version, build())
+    # workers map one shared Arrow snapshot per data version instead of
+    # each parsing and holding a private copy of every table
+    name = version if years is None else f"{version}-{years[0]}-{years[1]}"
+    tables = load_snapshot(name, build)
+    aff_store = load_artifact(
+        name, "aff_store.json", lambda: build_aff_store(tables[3])
+    )
+    return Dataset(version, tables, aff_store)
+
+
+class DatasetHolder:
+    """Holds the current Dataset and swaps in new versions atomically.
+
+    New snapshots are loaded in a background thread while the old one keeps
+    serving; the swap is a single reference assignment, so in-flight
+    callbacks finish on the snapshot they started with and the old one is
+    freed once they return. Both versions are in memory during a reload.
+    """
+
+    def __init__(self, dataset, loader=load_dataset):
+        self._dataset = dataset
+        self._loader = loader
+        self._listeners = []
+        self._swap_lock = threading.Lock()
+        self._reloading = threading.Lock()
+        self._watcher_pid = None
+
+    @property
+    def version(self):
+        return self._dataset.version
+
+    def get(self):
+        """The current snapshot; also tags the response with its version."""
+        dataset = self._dataset
+        if flask.has_request_context():
+            flask.g.data_version = dataset.version
+        return dataset
+
+    def on_swap(self, func):
+        """Register `func(old, new, changed)`, called after every swap."""
+        self._listeners.append(func)
+        return func
+
+    def swap(self, dataset, changed=None):
+        """Make `dataset` current. `changed` lists the (country, year) keys
+        that differ from the old version, or is None if unknown."""
+        with self._swap_lock:
+            old, self._dataset = self._dataset, dataset
+            for listener in self._listeners:
+                listener(old, dataset, changed)
+        logger.info("dataset %s replaced by %s", old.version, dataset.version)
+
+    def reload(self, changed=None, wait=False):
+        """Load a new snapshot in the background and swap it in.
+
+        With `changed` the loader only reloads those (country, year) keys
+        into a copy of the current snapshot. Returns False when a reload is
+        already running.
+        """
+        if not self._reloading.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                if changed is None:
+                    dataset = self._loader()
+                else:
+                    dataset = self._loader(previous=self._dataset, changed=changed)
+                if dataset.version != self.version:
+                    self.swap(dataset, changed)
+                del dataset
+                gc.collect()  # release the old snapshot's frames promptly
+            except Exception:
+                logger.exception("dataset reload failed, keeping %s", self.version)
+            finally:
+                self._reloading.release()
+
+        thread = threading.Thread(target=run, name="dataset-reload", daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return True
+
+    def watch(self, interval, version=data_version):
+        """Reload whenever the input files' fingerprint changes, every `interval` s."""
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    if version() != self.version:
+                        self.reload()
+                except OSError:
+                    logger.exception("checking the data version failed")
+
+        self._watcher_pid = os.getpid()
+        threading.Thread(target=run, name="dataset-watch", daemon=True).start()
+
+    def register(self, server, reload_interval=None):
+        """Tag responses with X-Data-Version and serve POST /reload (local only).
+
+        With `reload_interval` every worker polls the data files and reloads
+        by itself; the watcher starts on a worker's first request, so it also
+        runs in workers forked from a preloaded app.
+        """
+
+        @server.before_request
+        def _start_watcher():
+            if reload_interval and self._watcher_pid != os.getpid():
+                self.watch(reload_interval)
+
+        @server.after_request
+        def _tag_version(response):
+            response.headers["X-Data-Version"] = flask.g.get(
+                "data_version", self.version
+            )
+            return response
+
+        @server.route("/reload", methods=["POST"])
+        def reload():
+            if flask.request.remote_addr not in ("127.0.0.1", "::1"):
+                flask.abort(403)
+            # the body may be the report of `python -m src.ingest --report`
+            body = flask.request.get_json(silent=True) or {}
+            changed = body.get("changed")
+            if changed is not None:
+                changed = frozenset((country, int(year)) for country, year in changed)
+            started = self.reload(changed)
+            return {"version": self.version, "reloading": started}, 202
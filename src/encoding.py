@@ -0,0 +1,153 @@
+"""Compact JSON for the figures the callbacks return.
+
+Dash serializes a figure as plain JSON: every float of every trace as
+decimal text, every date as an ISO timestamp and the full layout template,
+which is most of the bytes of the smaller charts. `compact_figure` returns
+the same figure as a plain dict that is cheaper to send and to encode:
+
+- numeric arrays drawn against an axis become base64 typed arrays
+  (`{"dtype": "f4", "bdata": ...}`, read natively by plotly.js >= 2.28),
+  as float32 when that loses nothing at display precision;
+- integer arrays of any attribute become the smallest integer typed array;
+- date arrays at midnight are sent as plain dates;
+- the template keeps only the trace types and subplots the figure uses.
+
+Dash encodes the dict with orjson when it is installed.
+"""
+
+import base64
+import datetime
+
+import numpy as np
+
+from .data import FLOAT32_TOLERANCE
+
+MIDNIGHT = datetime.time()
+
+# shorter arrays stay JSON lists: the typed-array wrapper costs more than it saves
+MIN_TYPED_LENGTH = 16
+
+# attributes whose values plotly.js formats through an axis on hover, so
+# float32 noise never reaches the page; other floats keep full precision
+AXIS_ARRAYS = {"x", "y", "z", "q1", "median", "q3", "lowerfence", "upperfence"}
+
+INT_DTYPES = [
+    ("i1", np.int8),
+    ("u1", np.uint8),
+    ("i2", np.int16),
+    ("u2", np.uint16),
+    ("i4", np.int32),
+    ("u4", np.uint32),
+]
+
+# template.layout sections that only apply to subplots of these trace types
+SUBPLOT_TRACES = {
+    "polar": {"scatterpolar", "scatterpolargl", "barpolar"},
+    "ternary": {"scatterternary"},
+    "scene": {"scatter3d", "surface", "mesh3d", "cone", "streamtube", "volume"},
+    "geo": {"scattergeo", "choropleth"},
+    "mapbox": {"scattermapbox", "choroplethmapbox", "densitymapbox"},
+}
+COLORSCALE_TRACES = {
+    "heatmap",
+    "heatmapgl",
+    "contour",
+    "histogram2d",
+    "histogram2dcontour",
+    "surface",
+    "choropleth",
+    "choroplethmapbox",
+    "densitymapbox",
+}
+
+
+def _typed(dtype, values):
+    return {"dtype": dtype, "bdata": base64.b64encode(values.tobytes()).decode()}
+
+
+def _dates(values):
+    """ISO dates when every datetime is at midnight, else `values` unchanged."""
+    try:
+        if all(value.time() == MIDNIGHT for value in values):
+            return [value.date().isoformat() for value in values]
+    except AttributeError:  # mixed with non-dates
+        pass
+    return values
+
+
+def _encode_array(values, key):
+    """A typed-array spec or date list for `values`, or `values` unchanged."""
+    if values.ndim != 1 or len(values) < MIN_TYPED_LENGTH:
+        return values
+    if values.dtype.kind == "O" and isinstance(values[0], datetime.datetime):
+        # plotly express hands dates over as datetime objects
+        return _dates(values)
+    if values.dtype.kind == "M":
+        days = values.astype("datetime64[D]")
+        if np.all((values == days) | np.isnat(values)):
+            return np.datetime_as_string(days).tolist()
+        return values
+    if values.dtype.kind not in "iuf":
+        return values
+
+    finite = values[np.isfinite(values)] if values.dtype.kind == "f" else values
+    if len(finite) == len(values) and np.array_equal(finite, np.round(finite)):
+        low, high = (finite.min(), finite.max()) if len(finite) else (0, 0)
+        for dtype, int_type in INT_DTYPES:
+            info = np.iinfo(int_type)
+            if info.min <= low and high <= info.max:
+                return _typed(dtype, values.astype(int_type))
+    if values.dtype.kind != "f" or key not in AXIS_ARRAYS:
+        return values
+    values = values.astype(np.float64)
+    downcast = values.astype(np.float32)
+    error = np.abs(downcast.astype(np.float64) - values)
+    if np.all(np.isnan(values) | (error < FLOAT32_TOLERANCE)):
+        return _typed("f4", downcast.astype("<f4"))
+    return _typed("f8", values.astype("<f8"))
+
+
+def _encode(value, key=None):
+    if isinstance(value, dict):
+        return {k: _encode(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return _encode_array(value, key)
+    return value
+
+
+def _trim_template(layout, data):
+    template = layout.get("template")
+    if not template:
+        return
+    types = {trace.get("type", "scatter") for trace in data}
+    template = dict(template)
+    if "data" in template:
+        template["data"] = {
+            kind: traces for kind, traces in template["data"].items() if kind in types
+        }
+    if "layout" in template:
+        template_layout = dict(template["layout"])
+        for section, kinds in SUBPLOT_TRACES.items():
+            if not types & kinds:
+                template_layout.pop(section, None)
+        colored = "coloraxis" in layout or types & COLORSCALE_TRACES
+        colored = colored or any(
+            isinstance(trace.get("marker", {}).get("color"), np.ndarray)
+            for trace in data
+        )
+        if not colored:
+            template_layout.pop("colorscale", None)
+            template_layout.pop("coloraxis", None)
+        template["layout"] = template_layout
+    layout["template"] = template
+
+
+def compact_figure(fig):
+    """The figure as a plain dict with typed arrays and a trimmed template."""
+    fig = fig.to_plotly_json() if hasattr(fig, "to_plotly_json") else dict(fig)
+    data = fig.get("data", [])
+    layout = dict(fig.get("layout", {}))
+    _trim_template(layout, data)
+    return {**fig, "data": _encode(data), "layout": layout}
@@ -0,0 +1,284 @@
+"""Incremental ingest of new WFP months into the partitioned store.
+
+    python -m src.ingest new_rows.parquet --report changes.json
+
+New rows (in the preprocessed schema of wfp_preprocessed.parquet) are
+upserted on (country, market, commodity, unit, pricetype, month). Only the
+country/year partitions that gained or changed rows are rewritten, only
+their affordability rows are recomputed, and the changed (country, year)
+keys are reported so caches can drop just the figures built from them.
+"""
+
+import os
+import json
+import logging
+import argparse
+from typing import NamedTuple
+
+import pandas as pd
+
+from .data import DATA_PATH, WFP_STORE
+from .store import read_wfp_store, write_wfp_partitions
+from .units import standardize_units
+
+logger = logging.getLogger(__name__)
+
+# a row is one price per market, commodity, unit and price type each month
+KEY_COLUMNS = ["country", "market", "commodity", "unit", "pricetype", "month"]
+
+AFFORDABILITY_PATH = os.path.join(DATA_PATH, "affordability_index.csv")
+NNI_PATH = os.path.join(DATA_PATH, "..", "raw", "adjusted_net_national_income.csv")
+
+# assumptions of reports/affordability_index.ipynb
+COMMODITIES_PER_WEEK = 15
+FOOD_SHARE_OF_INCOME = 0.60
+MAX_AFFORDABILITY_RATIO = 5
+
+
+class IngestResult(NamedTuple):
+    changed: frozenset  # (country, year) keys with new or updated rows
+    inserted: int
+    updated: int
+    unchanged: int
+
+
+def _keys(df):
+    key = df[[c for c in KEY_COLUMNS if c != "month"]].astype(str)
+    key["month"] = df["date"].dt.to_period("M").astype(str)
+    return pd.MultiIndex.from_frame(key)
+
+
+def upsert(existing, new):
+    """Merge `new` into `existing`, new rows winning on the same key.
+
+    Returns the merged frame and two boolean masks over `new`: rows that are
+    inserted or differ from the row they replace, and rows that are inserted.
+    """
+    new = new.reindex(columns=existing.columns)
+    existing_keys, new_keys = _keys(existing), _keys(new)
+
+    # compare as strings so categorical, object and float columns line up
+    value_columns = [c for c in existing.columns if c not in ("country", "year")]
+    existing_hashes = pd.util.hash_pandas_object(
+        existing[value_columns].astype(str), index=False
+    ).to_numpy()
+    new_hashes = pd.util.hash_pandas_object(
+        new[value_columns].astype(str), index=False
+    ).to_numpy()
+
+    unique = ~existing_keys.duplicated(keep="last")
+    position = existing_keys[unique].get_indexer(new_keys)
+    inserted = position == -1
+    changed = inserted | (existing_hashes[unique][position] != new_hashes)
+
+    keep = ~existing_keys.isin(new_keys)
+    merged = pd.concat([existing[keep], new], ignore_index=True)
+    return merged, changed, inserted
+
+
+def ingest(new, root=WFP_STORE):
+    """Upsert `new` rows into the store and rewrite only the changed partitions."""
+    if not os.path.isdir(root):
+        raise FileNotFoundError(
+            f"{root} not found, build the store first with `python -m src.store`"
+        )
+    missing = {c for c in KEY_COLUMNS if c != "month"} - set(new.columns)
+    if missing:
+        raise ValueError(f"new rows are missing key columns: {sorted(missing)}")
+
+    new = new.copy()
+    new["date"] = pd.to_datetime(new["date"])
+    new["year"] = new["date"].dt.year.astype("int16")
+    # rows straight from the collector have no standardized price yet
+    if "standardprice" not in new.columns:
+        new = standardize_units(new)
+    elif new["standardprice"].isna().any():
+        raw = new["standardprice"].isna()
+        columns = ["Value", "Unit", "standardprice"]
+        new.loc[raw, columns] = standardize_units(new[raw].copy())[columns]
+    new = new[~_keys(new).duplicated(keep="last")]
+
+    pairs = set(zip(new["country"], new["year"].astype(int)))
+    countries = sorted({country for country, _ in pairs})
+    years = (min(y for _, y in pairs), max(y for _, y in pairs))
+    existing = read_wfp_store(root, countries=countries, years=years)
+    existing = existing[
+        pd.Series(list(zip(existing["country"], existing["year"].astype(int))))
+        .isin(pairs)
+        .to_numpy()
+    ]
+
+    merged, changed, inserted = upsert(existing, new)
+    changed_keys = frozenset(
+        (country, int(year))
+        for country, year in zip(new["country"][changed], new["year"][changed])
+    )
+
+    if changed_keys:
+        rewrite = pd.Series(
+            list(zip(merged["country"], merged["year"].astype(int)))
+        ).isin(changed_keys)
+        write_wfp_partitions(merged[rewrite.to_numpy()], root)
+
+    result = IngestResult(
+        changed=changed_keys,
+        inserted=int(inserted.sum()),
+        updated=int((changed & ~inserted).sum()),
+        unchanged=int((~changed).sum()),
+    )
+    logger.info(
+        "ingest: %d inserted, %d updated, %d unchanged, %d partitions rewritten",
+        result.inserted,
+        result.updated,
+        result.unchanged,
+        len(result.changed),
+    )
+    return result
+
+
+# ------------------------------ derived tables ------------------------------
+
+
+def load_nni(path=NNI_PATH):
+    """Adjusted net national income per capita as (Country Code, year, Adjusted NNI)."""
+    nni = pd.read_csv(path)
+    year_cols = [col for col in nni.columns if "[YR" in col]
+    nni_long = nni[year_cols + ["Country Code"]].melt(
+        id_vars=["Country Code"], var_name="year", value_name="Adjusted NNI"
+    )
+    nni_long["year"] = nni_long["year"].str.extract(r"(\d{4})", expand=False)
+    nni_long["year"] = nni_long["year"].astype(int)
+    nni_long["Adjusted NNI"] = pd.to_numeric(nni_long["Adjusted NNI"], errors="coerce")
+    return nni_long.dropna(subset=["Adjusted NNI"])
+
+
+def affordability_rows(wfp, nni):
+    """Affordability ratio per (country, year), as in the affordability notebook."""
+    wfp = wfp.assign(standardprice=wfp["standardprice"].astype("float64"))
+    avg_price = (
+        wfp.groupby(["country", "countryiso3", "year"], observed=True)["standardprice"]
+        .mean()
+        .reset_index()
+    )
+    avg_price["country"] = avg_price["country"].astype(str)
+    avg_price["countryiso3"] = avg_price["countryiso3"].astype(str)
+    avg_price["year"] = avg_price["year"].astype(int)
+    rows = avg_price.merge(
+        nni,
+        how="left",
+        left_on=["countryiso3", "year"],
+        right_on=["Country Code", "year"],
+    ).drop(columns=["Country Code"])
+    rows = rows.dropna()
+    rows["est_annual_cost"] = rows["standardprice"] * COMMODITIES_PER_WEEK * 52
+    rows["est_annual_budget"] = rows["Adjusted NNI"] * FOOD_SHARE_OF_INCOME
+    rows["affordability_ratio"] = rows["est_annual_budget"] / rows["est_annual_cost"]
+    return rows[rows["affordability_ratio"] <= MAX_AFFORDABILITY_RATIO]
+
+
+def update_affordability(aff_index, changed, root=WFP_STORE, nni=None):
+    """Recompute the affordability rows of `changed` (country, year) keys.
+
+    The 0-100 index is normalized over all rows, so it is rescaled for the
+    whole (small) table; the ratios of unchanged rows are kept as they are.
+    """
+    if not changed:
+        return aff_index
+    nni = load_nni() if nni is None else nni
+    countries = sorted({country for country, _ in changed})
+    years = (min(y for _, y in changed), max(y for _, y in changed))
+    wfp = read_wfp_store(
+        root,
+        countries=countries,
+        years=years,
+        columns=["country", "countryiso3", "year", "standardprice"],
+    )
+    wfp = wfp[
+        pd.Series(list(zip(wfp["country"], wfp["year"].astype(int))))
+        .isin(changed)
+        .to_numpy()
+    ]
+
+    stale = pd.Series(list(zip(aff_index["country"], aff_index["year"]))).isin(changed)
+    aff = pd.concat(
+        [
+            aff_index[~stale.to_numpy()].drop(columns=["affordability_index"]),
+            affordability_rows(wfp, nni),
+        ],
+        ignore_index=True,
+    )
+    aff = aff.sort_values(["country", "year"], ignore_index=True)
+
+    ratio = aff["affordability_ratio"]
+    aff["affordability_index"] = (
+        100 * (ratio - ratio.min()) / (ratio.max() - ratio.min())
+    ).clip(0, 100)
+    return aff
+
+
+def cache_predicate(changed):
+    """Predicate matching the cached figures built from `changed` keys.
+
+    Cache keys are (name, data version, *callback inputs).
+    """
+    years_by_country = {}
+    for country, year in changed:
+        years_by_country.setdefault(country, set()).add(year)
+
+    def predicate(key):
+        name, _, *args = key
+        if name in ("map-graph", "box-bar"):
+            return (args[0], args[1]) in changed
+        if name == "price-chart":
+            countries, (start, end), _ = args
+            return any(
+                start <= year <= end
+                for country in countries
+                for year in years_by_country.get(country, ())
+            )
+        return False  # the FAO chart does not read WFP rows
+
+    return predicate
+
+
+def read_rows(path):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, parse_dates=["date"])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Upsert new WFP rows into the partitioned store"
+    )
+    parser.add_argument("src", help="new rows as .parquet or .csv")
+    parser.add_argument("--store", default=WFP_STORE)
+    parser.add_argument("--affordability", default=AFFORDABILITY_PATH)
+    parser.add_argument("--nni", default=NNI_PATH)
+    parser.add_argument("--report", help="write the changed (country, year) keys here")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    result = ingest(read_rows(args.src), args.store)
+
+    if result.changed and os.path.exists(args.affordability):
+        aff_index = pd.read_csv(args.affordability, index_col=0)
+        aff_index = update_affordability(
+            aff_index, result.changed, args.store, load_nni(args.nni)
+        )
+        aff_index.to_csv(args.affordability)
+
+    print(
+        f"{result.inserted} inserted, {result.updated} updated, "
+        f"{result.unchanged} unchanged"
+    )
+    changed = sorted(result.changed)
+    for country, year in changed:
+        print(f"changed: {country} {year}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"changed": changed}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Grouped reductions over integer-coded keys.
+
+The plot aggregations group by categorical columns, so their keys are
+already small integer codes. Sorting the codes once makes every group a
+contiguous segment; sums and counts are then one `np.add.reduceat` over the
+segment starts, and the largest groups are found with `np.argpartition`
+instead of sorting all of them. Groups come out in code order, the order of
+a pandas groupby on the same categoricals with observed=True.
+"""
+
+import numpy as np
+
+
+def sort_segments(*keys):
+    """Order that sorts the rows by `keys`, and the start of every group.
+
+    `keys` are equal-length integer arrays, most significant first; the sort
+    is stable, so rows keep their order within a group.
+    """
+    keys = [np.asarray(key) for key in keys]
+    if len(keys) == 1:
+        order = np.argsort(keys[0], kind="stable")
+    else:
+        order = np.lexsort(keys[::-1])
+    if not len(order):
+        return order, np.empty(0, dtype=np.intp)
+    changed = np.zeros(len(order), dtype=bool)
+    changed[0] = True
+    for key in keys:
+        ordered = key[order]
+        changed[1:] |= ordered[1:] != ordered[:-1]
+    return order, np.flatnonzero(changed)
+
+
+def segment_sum(values, starts):
+    """Sum of every segment, skipping NaN; an all-NaN segment sums to 0."""
+    if not len(starts):
+        return np.zeros(0, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    return np.add.reduceat(np.where(np.isnan(values), 0.0, values), starts)
+
+
+def segment_count(values, starts):
+    """Number of non-NaN values in every segment."""
+    if not len(starts):
+        return np.zeros(0, dtype=np.int64)
+    present = ~np.isnan(np.asarray(values, dtype=np.float64))
+    return np.add.reduceat(present.astype(np.int64), starts)
+
+
+def segment_mean(values, starts):
+    """Mean of every segment, skipping NaN; NaN for an all-NaN segment."""
+    sums = segment_sum(values, starts)
+    counts = segment_count(values, starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def top_k(values, k):
+    """Positions of the `k` largest values, largest first.
+
+    Ties keep their original order and NaN sorts last, as in a stable
+    `sort_values(ascending=False).head(k)`. Only the candidates picked by
+    `np.argpartition` are sorted.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = np.flatnonzero(~np.isnan(values))
+    if k < len(valid):
+        kth = valid[np.argpartition(-values[valid], k - 1)[k - 1]]
+        # every value tied with the k-th is a candidate, so ties stay stable
+        valid = valid[values[valid] >= values[kth]]
+    top = valid[np.lexsort((valid, -values[valid]))][:k]
+    if len(top) < k:
+        missing = np.flatnonzero(np.isnan(values))[: k - len(top)]
+        top = np.concatenate([top, missing])
+    return top
+
+
+def bucket_extremes(keys, values):
+    """Positions of the first, last, smallest and largest value of every bucket.
+
+    `keys` must be sorted, so every bucket is one segment; one stable sort by
+    (key, value) puts each bucket's minimum at its start and its maximum at
+    its end. Returns sorted positions, at most four per bucket.
+    """
+    keys = np.asarray(keys)
+    if not len(keys):
+        return np.empty(0, dtype=np.intp)
+    starts = np.flatnonzero(np.diff(keys, prepend=keys[0] - 1))
+    stops = np.append(starts[1:], len(keys)) - 1
+    by_value = np.lexsort((values, keys))
+    return np.unique(np.concatenate([starts, stops, by_value[starts], by_value[stops]]))
@@ -0,0 +1,261 @@
+"""Per-callback latency, phase and payload metrics in Prometheus text format.
+
+Metrics are off unless METRICS_ENABLED=1. When off, `instrument` returns the
+app untouched and `phase` is a shared no-op context manager, so the hot path
+pays for nothing but a function call. Counters are per worker process.
+"""
+
+import os
+import time
+import threading
+import functools
+import contextlib
+
+import flask
+
+from . import startup
+
+ENABLED = os.environ.get("METRICS_ENABLED") == "1"
+
+# seconds; callbacks range from sub-millisecond lookups to multi-second builds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+
+_NULL_PHASE = contextlib.nullcontext()
+_local = threading.local()
+_lock = threading.RLock()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {self.sum:.6f}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+class CallbackStats:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.response_bytes = Histogram(SIZE_BUCKETS)
+        self.phases = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.errors = 0
+
+
+_callbacks = {}
+
+
+def _stats(name):
+    stats = _callbacks.get(name)
+    if stats is None:
+        with _lock:
+            stats = _callbacks.setdefault(name, CallbackStats())
+    return stats
+
+
+class _Phase:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        callback = getattr(_local, "callback", None)
+        if callback is not None:
+            elapsed = time.perf_counter() - self.start
+            phases = _stats(callback).phases
+            with _lock:
+                phases[self.name] = phases.get(self.name, 0.0) + elapsed
+
+
+def phase(name):
+    """Time a block (filter, groupby, figure, ...) of the current callback."""
+    if not ENABLED:
+        return _NULL_PHASE
+    return _Phase(name)
+
+
+def record_cache_lookup(hit):
+    if not ENABLED:
+        return
+    callback = getattr(_local, "callback", None)
+    if callback is None:
+        return
+    stats = _stats(callback)
+    with _lock:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+def _timed(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _local.callback = name
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            with _lock:
+                _stats(name).errors += 1
+            raise
+        finally:
+            end = time.perf_counter()
+            with _lock:
+                _stats(name).duration.observe(end - start)
+            _local.callback = None
+            if flask.has_request_context():
+                # the response size and serialize phase are taken in after_request
+                flask.g.metrics_callback = name
+                flask.g.metrics_callback_end = end
+
+    return wrapper
+
+
+class InstrumentedApp:
+    """Proxy for a Dash app whose `callback` decorator records metrics."""
+
+    def __init__(self, app):
+        self._app = app
+
+    def callback(self, *args, **kwargs):
+        register = self._app.callback(*args, **kwargs)
+
+        def decorator(func):
+            return register(_timed(func.__name__, func))
+
+        return decorator
+
+    def __getattr__(self, name):
+        return getattr(self._app, name)
+
+
+def instrument(app):
+    """Return `app` wrapped for metrics, or unchanged when metrics are off."""
+    return InstrumentedApp(app) if ENABLED else app
+
+
+def _after_request(response):
+    name = flask.g.pop("metrics_callback", None)
+    if name is None:
+        return response
+    end = flask.g.pop("metrics_callback_end")
+    stats = _stats(name)
+    size = response.calculate_content_length() or 0
+    with _lock:
+        stats.response_bytes.observe(size)
+        # Dash serializes the return value between the callback and here
+        stats.phases["serialize"] = stats.phases.get("serialize", 0.0) + (
+            time.perf_counter() - end
+        )
+    return response
+
+
+def render(cache=None):
+    lines = [
+        "# HELP dash_callback_duration_seconds Wall time of Dash callbacks.",
+        "# TYPE dash_callback_duration_seconds histogram",
+    ]
+    with _lock:
+        callbacks = sorted(_callbacks.items())
+        for name, stats in callbacks:
+            lines.extend(
+                stats.duration.lines(
+                    "dash_callback_duration_seconds", f'callback="{name}"'
+                )
+            )
+
+        lines += [
+            "# HELP dash_callback_phase_seconds_total Time spent per callback phase.",
+            "# TYPE dash_callback_phase_seconds_total counter",
+        ]
+        for name, stats in callbacks:
+            for phase_name, seconds in sorted(stats.phases.items()):
+                lines.append(
+                    f'dash_callback_phase_seconds_total{{callback="{name}",phase="{phase_name}"}} {seconds:.6f}'
+                )
+
+        lines += [
+            "# HELP dash_callback_response_bytes Serialized callback response size.",
+            "# TYPE dash_callback_response_bytes histogram",
+        ]
+        for name, stats in callbacks:
+            lines.extend(
+                stats.response_bytes.lines(
+                    "dash_callback_response_bytes", f'callback="{name}"'
+                )
+            )
+
+        for metric, attr, help_text in [
+            (
+                "dash_callback_cache_hits_total",
+                "cache_hits",
+                "Figure cache hits per callback.",
+            ),
+            (
+                "dash_callback_cache_misses_total",
+                "cache_misses",
+                "Figure cache misses per callback.",
+            ),
+            ("dash_callback_errors_total", "errors", "Callbacks that raised."),
+        ]:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for name, stats in callbacks:
+                lines.append(f'{metric}{{callback="{name}"}} {getattr(stats, attr)}')
+
+    lines += [
+        "# HELP dash_startup_seconds Wall time of each cold-start phase of this worker.",
+        "# TYPE dash_startup_seconds gauge",
+    ]
+    for phase_name, seconds in startup.PHASES.items():
+        lines.append(f'dash_startup_seconds{{phase="{phase_name}"}} {seconds:.6f}')
+
+    if cache is not None:
+        stats = cache.stats()
+        lines += [
+            "# HELP dash_figure_cache_hit_ratio Figure cache hit ratio of this worker.",
+            "# TYPE dash_figure_cache_hit_ratio gauge",
+            f"dash_figure_cache_hit_ratio {stats['hit_rate']:.6f}",
+            "# TYPE dash_figure_cache_entries gauge",
+            f"dash_figure_cache_entries {stats['entries']}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def register_endpoint(server, cache=None):
+    """Serve /metrics on the Flask server, to local clients only."""
+    if not ENABLED:
+        return
+    server.after_request(_after_request)
+
+    @server.route("/metrics")
+    def metrics():
+        if flask.request.remote_addr not in ("127.0.0.1", "::1") and not os.environ.get(
+            "METRICS_PUBLIC"
+        ):
+            flask.abort(403)
+        return flask.Response(render(cache), mimetype="text/plain; version=0.0.4")
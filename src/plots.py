@@ -1,7 +1,34 @@
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 
+from dash import Patch
+
+from . import kernels
+from .encoding import compact_figure
+from .metrics import phase
+
+# For the global tab
+PRICE_CHART_WIDTH = 600
+# points the price chart draws per pixel of width, over all countries
+# together; longer selections are reduced to the extremes of every time
+# bucket, with the budget split evenly across the countries. At the default
+# width it stays below WEBGL_POINTS, so a reduced chart still draws as SVG
+PRICE_POINTS_PER_PX = 2
+# time buckets kept per country however many are selected (about one a year
+# of the full range); past ~25 countries this floor exceeds the budget
+MIN_PRICE_BUCKETS = 12
+# above this many points the lines are drawn with WebGL instead of SVG
+WEBGL_POINTS = 1500
+# line colors of the price and undernourishment charts, assigned by position
+SERIES_COLORS = px.colors.qualitative.Pastel
+
 # For the country tab
+# market trace attributes that change with the year on the map
+MAP_MARKET_KEYS = ["lat", "lon", "hovertext", "customdata", "marker"]
+# outlier points kept per category when the box plot ships precomputed stats
+BOX_MAX_OUTLIERS = 50
+
 COLOR_MAP = {
     "cereals and tubers": "rgb(102, 197, 204)",
     "miscellaneous food": "rgb(246, 207, 113)",
@@ -13,19 +40,14 @@ COLOR_MAP = {
 }
 
 
-def get_hist(aff_index, selected_year):
-    filtered_data = aff_index[aff_index["year"] == selected_year]
+def get_hist(aff_panel, selected_year):
+    # bin counts are precomputed per year by data.build_aff_panel
+    bins = aff_panel["hist"].get(str(selected_year), {"x": [], "y": []})
 
-    fig = px.histogram(
-        filtered_data,
-        x="affordability_ratio",
-        nbins=30,  # Adjust the number of bins as needed
-        # title="Distribution of Affordability Ratios (Latest Year)",
-        labels={"affordability_ratio": "Affordability Ratio"},
-        template="plotly_white",
-    )
+    fig = go.Figure(_hist_trace(bins))
 
     fig.update_layout(
+        template="plotly_white",
         xaxis_title="Affordability Ratio",
         yaxis_title="Number of Countries",
         bargap=0.05,
@@ -34,30 +56,66 @@ def get_hist(aff_index, selected_year):
     return fig
 
 
-def get_price_chart(
-    wfp, selected_countries, year_range, selected_commodity, essential_commodities
-):
-    if not selected_countries:
-        return {}
+def _hist_trace(bins):
+    return go.Bar(
+        x=bins["x"],
+        y=bins["y"],
+        hovertemplate="Affordability Ratio=%{x}<br>count=%{y}<extra></extra>",
+    )
 
-    start_year, end_year = year_range
-    filtered_data = wfp[
-        wfp["country"].isin(selected_countries)
-        & wfp["date"].dt.year.between(start_year, end_year)
-    ]
 
+def get_hist_figures(aff_panel):
+    """Histogram traces per year plus one shared layout, for the clientside callback."""
+    years = list(aff_panel["hist"])
+    # the layout is the same every year, so only one full figure is built
+    layout = get_hist(aff_panel, years[0]).to_plotly_json()["layout"] if years else {}
+    return {
+        "layout": layout,
+        "data": {
+            year: [_hist_trace(aff_panel["hist"][year]).to_plotly_json()]
+            for year in years
+        },
+    }
+
+
+def downsample_series(result, n_buckets):
+    """Keep the first, last, lowest and highest point of every time bucket.
+
+    The buckets split the selection's date range evenly and are the same for
+    every country, so they line up with pixel columns; price spikes survive,
+    unlike with plain decimation.
+    """
+    dates = result["date"].to_numpy().view("int64")
+    first, last = dates.min(), dates.max()
+    buckets = ((dates - first) / (last - first + 1) * n_buckets).astype(np.int64)
+    # price_series returns each country's rows together, sorted by date
+    series = result["country"].ne(result["country"].shift()).cumsum().to_numpy()
+    keep = kernels.bucket_extremes(
+        series * n_buckets + buckets, result["avg_usdprice"].to_numpy()
+    )
+    return result.iloc[keep]
+
+
+def _price_group(selected_commodity):
     if selected_commodity == "Essential Commodities":
-        filtered_data = filtered_data[
-            filtered_data["commodity"].isin(essential_commodities)
-        ]
-
-    result = (
-        filtered_data.groupby(["country", "date"], as_index=False)["standardprice"]
-        .mean()
-        .rename(columns={"standardprice": "avg_usdprice"})
+        return "Essential Commodities"
+    return "All Commodities"
+
+
+def _price_xaxis(result, start_year):
+    years = result["date"].dt.year.unique().tolist()
+    max_year = result["date"].max().year
+    return dict(
+        tickvals=years,
+        ticktext=[str(year) for year in years],
+        range=[
+            f"{start_year}-01-01",
+            f"{max_year}-01-01",
+        ],  # aligns x-axis ticks when we scale with slider
     )
-    result["avg_usdprice"] = result["avg_usdprice"].round(3)
 
+
+def _price_figure(result, start_year, width):
     fig = px.line(
         result,
         x="date",
@@ -69,24 +127,18 @@ def get_price_chart(
             "country": "Country",
         },
         height=350,
-        width=600,
-        color_discrete_sequence=px.colors.qualitative.Pastel,
+        width=width,
+        color_discrete_sequence=SERIES_COLORS,
+        render_mode="webgl" if len(result) > WEBGL_POINTS else "svg",
     )
 
-    years = result["date"].dt.year.unique()
-    max_year = result["date"].max().year
     fig.update_layout(
         # plot_bgcolor="rgba(240, 248, 255, 0.9)",
         template="simple_white",  # add
         xaxis=dict(
             title="Year",
             tickmode="array",
-            tickvals=years,
-            ticktext=[str(year) for year in years],
-            range=[
-                f"{start_year}-01-01",
-                f"{max_year}-01-01",
-            ],  # aligns x-axis ticks when we scale with slider
+            **_price_xaxis(result, start_year),
         ),
         yaxis=dict(
             title="Average Price (USD)",
@@ -102,17 +154,137 @@ def get_price_chart(
         line=dict(width=2),
         hovertemplate=("%{fullData.name}: <b>%{y}</b><extra></extra>"),
     )
+    return fig
+
+
+def get_price_chart(
+    backend,
+    selected_countries,
+    year_range,
+    selected_commodity,
+    width=PRICE_CHART_WIDTH,
+):
+    if not selected_countries:
+        return {}
+
+    start_year, end_year = year_range
+    with phase("filter"):
+        result = backend.price_series(
+            _price_group(selected_commodity),
+            sorted(set(selected_countries)),
+            start_year,
+            end_year,
+        )
+        budget = width * PRICE_POINTS_PER_PX
+        if len(result) > budget:
+            # at most four points per bucket and country
+            n_series = result["country"].nunique()
+            n_buckets = max(budget // (4 * n_series), MIN_PRICE_BUCKETS)
+            result = downsample_series(result, n_buckets)
+
+    with phase("figure"):
+        fig = _price_figure(result, start_year, width)
 
     return fig
 
 
-def get_undernourishment_chart(fao_grouped, selected_countries, year_range):
+def _series_patch(shown, names, traces):
+    """Patch turning a chart with one trace per name in `shown` into `names`.
+
+    `traces` holds the compact traces of the names not shown yet. Plotly
+    express colors the traces by position, so kept traces that move to
+    another palette color are recolored. None when the kept traces would
+    change order.
+    """
+    kept = set(shown) & set(names)
+    if [name for name in shown if name in kept] != [
+        name for name in names if name in kept
+    ]:
+        return None
+
+    patch = Patch()
+    # deletions from the back, then inserts in final order: every index is
+    # where the trace ends up
+    for index in reversed(range(len(shown))):
+        if shown[index] not in kept:
+            del patch["data"][index]
+    old_index = {name: index for index, name in enumerate(shown)}
+    for index, name in enumerate(names):
+        color = SERIES_COLORS[index % len(SERIES_COLORS)]
+        if name not in kept:
+            trace = traces[name]
+            trace["line"]["color"] = color
+            patch["data"].insert(index, trace)
+        elif SERIES_COLORS[old_index[name] % len(SERIES_COLORS)] != color:
+            patch["data"][index]["line"]["color"] = color
+    return patch
+
+
+def _traces_by_name(fig):
+    return {trace["name"]: trace for trace in compact_figure(fig)["data"]}
+
+
+def get_price_chart_patch(
+    backend,
+    shown,
+    selected_countries,
+    year_range,
+    selected_commodity,
+    width=PRICE_CHART_WIDTH,
+):
+    """Patch for a price chart of the same years and commodity showing `shown`.
+
+    Only the traces of added countries are built and sent. Returns the patch
+    and the countries now shown, or None when the change needs a full figure:
+    when either selection is downsampled or drawn with WebGL.
+    """
+    if not selected_countries:
+        return None
+
+    start_year, end_year = year_range
+    with phase("filter"):
+        # the union bounds the size of both the old and the new figure
+        union = backend.price_series(
+            _price_group(selected_commodity),
+            sorted(set(shown) | set(selected_countries)),
+            start_year,
+            end_year,
+        )
+        # below both limits neither selection is downsampled or drawn with WebGL
+        if len(union) > min(width * PRICE_POINTS_PER_PX, WEBGL_POINTS):
+            return None
+        result = union[union["country"].isin(selected_countries)]
+        if result.empty:
+            return None
+        names = result["country"].unique().tolist()
+
+    with phase("figure"):
+        added = result[~result["country"].isin(shown)]
+        traces = {}
+        if not added.empty:
+            traces = _traces_by_name(_price_figure(added, start_year, width))
+        patch = _series_patch(shown, names, traces)
+        if patch is None:
+            return None
+        patch["layout"]["xaxis"].update(_price_xaxis(result, start_year))
+
+    return patch, names
+
+
+def _filter_fao(fao_grouped, selected_countries, year_range):
     start_year, end_year = year_range
-    fao_filtered = fao_grouped[
+    return fao_grouped[
         (fao_grouped["Area"].isin(selected_countries))
         & (fao_grouped["Year"].between(start_year, end_year))
     ]
 
+
+def _fao_xaxis(fao_filtered):
+    years = fao_filtered["Year"].unique().tolist()
+    return dict(tickvals=years, ticktext=[str(year) for year in years])
+
+
+def _undernourishment_figure(fao_filtered):
     fig = px.line(
         fao_filtered,
         x="Year",
@@ -121,18 +293,16 @@ def get_undernourishment_chart(fao_grouped, selected_countries, year_range):
         # title="Share of the population that is undernourished",
         height=350,
         width=600,
-        color_discrete_sequence=px.colors.qualitative.Pastel,
+        color_discrete_sequence=SERIES_COLORS,
         markers=True,  # add
     )
 
-    years = fao_filtered["Year"].unique()
     fig.update_layout(
         template="simple_white",
         xaxis=dict(
             title="Year",
             tickmode="array",
-            tickvals=years,
-            ticktext=[str(year) for year in years],
+            **_fao_xaxis(fao_filtered),
             # range=[start_year, end_year]
         ),
         yaxis=dict(
@@ -148,181 +318,252 @@ def get_undernourishment_chart(fao_grouped, selected_countries, year_range):
         line=dict(width=2),
         hovertemplate=("%{fullData.name}: <b>%{y}</b><extra></extra>"),
     )
+    return fig
+
+
+def get_undernourishment_chart(fao_grouped, selected_countries, year_range):
+    with phase("filter"):
+        fao_filtered = _filter_fao(fao_grouped, selected_countries, year_range)
+
+    with phase("figure"):
+        fig = _undernourishment_figure(fao_filtered)
 
     return fig
 
 
-def get_map(df, country, year):
-    df_prep = df[df["country"] == country]
-    df_grouped = (
-        df_prep.groupby([df_prep["date"].dt.year, "admin2", "latitude", "longitude"])[
-            "standardprice"
-        ]
-        .mean()
-        .reset_index()
-    )
-    df_grouped["standardprice"] = df_grouped["standardprice"].round(3)
-    df_grouped_year = df_grouped[df_grouped["date"] == year]
-    df_grouped_year["standardprice"] = df_grouped["standardprice"].fillna(0)
-
-    fig = px.scatter_mapbox(
-        df_grouped_year,
-        lat="latitude",
-        lon="longitude",
-        size="standardprice",
-        color="standardprice",
-        color_continuous_scale="Oranges",
-        hover_name="admin2",
-        hover_data={"latitude": False, "longitude": False},
-        zoom=5,
-        custom_data=["admin2"],
-        mapbox_style="open-street-map",
-    )
-    # For dummy legend
-    min_color = "rgb(255,245,235)"  # Light orange (lower price)
-    max_color = "rgb(127,39,4)"  # Dark orange (higher price)
-
-    dummy_lat = -90
-    dummy_lon = 0
-
-    # Dummy trace for higher prices
-    fig.add_trace(
-        go.Scattermapbox(
-            lat=[dummy_lat],
-            lon=[dummy_lon],
-            mode="markers",
-            marker=dict(size=10, color=max_color, opacity=1),
-            name="Higher Price",
-            showlegend=True,
-            hoverinfo="none",
+def get_undernourishment_patch(fao_grouped, shown, selected_countries, year_range):
+    """Patch for an undernourishment chart of the same years showing `shown`.
+
+    Returns the patch and the countries now shown, or None when the change
+    needs a full figure.
+    """
+    with phase("filter"):
+        fao_filtered = _filter_fao(fao_grouped, selected_countries, year_range)
+        if fao_filtered.empty:
+            return None
+        names = fao_filtered["Area"].unique().tolist()
+
+    with phase("figure"):
+        added = fao_filtered[~fao_filtered["Area"].isin(shown)]
+        traces = {}
+        if not added.empty:
+            traces = _traces_by_name(_undernourishment_figure(added))
+        patch = _series_patch(shown, names, traces)
+        if patch is None:
+            return None
+        patch["layout"]["xaxis"].update(_fao_xaxis(fao_filtered))
+
+    return patch, names
+
+
+def get_map(backend, country, year):
+    with phase("filter"):
+        df_grouped_year = backend.market_prices(country, year)
+
+    with phase("figure"):
+        fig = px.scatter_mapbox(
+            df_grouped_year,
+            lat="latitude",
+            lon="longitude",
+            size="standardprice",
+            color="standardprice",
+            color_continuous_scale="Oranges",
+            hover_name="admin2",
+            hover_data={"latitude": False, "longitude": False},
+            zoom=5,
+            custom_data=["admin2"],
+            mapbox_style="open-street-map",
+        )
+        # For dummy legend
+        min_color = "rgb(255,245,235)"  # Light orange (lower price)
+        max_color = "rgb(127,39,4)"  # Dark orange (higher price)
+
+        dummy_lat = -90
+        dummy_lon = 0
+
+        # Dummy trace for higher prices
+        fig.add_trace(
+            go.Scattermapbox(
+                lat=[dummy_lat],
+                lon=[dummy_lon],
+                mode="markers",
+                marker=dict(size=10, color=max_color, opacity=1),
+                name="Higher Price",
+                showlegend=True,
+                hoverinfo="none",
+            )
         )
-    )
 
-    # Dummy trace for lower prices
-    fig.add_trace(
-        go.Scattermapbox(
-            lat=[dummy_lat],
-            lon=[dummy_lon],
-            mode="markers",
-            marker=dict(size=10, color=min_color, opacity=1),
-            name="Lower Price",
-            showlegend=True,
-            hoverinfo="none",
+        # Dummy trace for lower prices
+        fig.add_trace(
+            go.Scattermapbox(
+                lat=[dummy_lat],
+                lon=[dummy_lon],
+                mode="markers",
+                marker=dict(size=10, color=min_color, opacity=1),
+                name="Lower Price",
+                showlegend=True,
+                hoverinfo="none",
+            )
         )
-    )
 
-    fig.update_layout(
-        autosize=True,
-        margin={"r": 0, "t": 0, "l": 0, "b": 0},
-        coloraxis_showscale=False,
-        showlegend=True,
-        legend=dict(
-            # title="Price Level",
-            orientation="h",
-            yanchor="top",
-            y=0.98,  # Top
-            xanchor="left",
-            x=0.02,  # # Left
-            bgcolor="rgba(255, 255, 255, 0.8)",
-            bordercolor="rgba(255, 255, 255, 0.8)",
-            borderwidth=1,
-            itemclick=False,
-            itemdoubleclick=False,
-        ),
-        legend_itemsizing="constant",
-    )
-    fig.update_traces(
-        selector=dict(type="scattermapbox", showlegend=False),
-        hoverlabel=dict(
-            bordercolor="rgba(0,0,0,0)",
-            font=dict(color="black"),
-        ),
-    )
+        fig.update_layout(
+            autosize=True,
+            margin={"r": 0, "t": 0, "l": 0, "b": 0},
+            coloraxis_showscale=False,
+            showlegend=True,
+            legend=dict(
+                # title="Price Level",
+                orientation="h",
+                yanchor="top",
+                y=0.98,  # Top
+                xanchor="left",
+                x=0.02,  # # Left
+                bgcolor="rgba(255, 255, 255, 0.8)",
+                bordercolor="rgba(255, 255, 255, 0.8)",
+                borderwidth=1,
+                itemclick=False,
+                itemdoubleclick=False,
+            ),
+            legend_itemsizing="constant",
+        )
+        fig.update_traces(
+            selector=dict(type="scattermapbox", showlegend=False),
+            hoverlabel=dict(
+                bordercolor="rgba(0,0,0,0)",
+                font=dict(color="black"),
+            ),
+        )
 
     return fig
 
 
-def get_box_plot(df, country, year, region=None):
-    df_box = df[(df["country"] == country) & (df["date"].dt.year == year)]
-    if region is not None:
-        df_box = df_box[df_box["admin2"] == region]
-
-    df_box["standardprice"] = df_box["standardprice"].round(3)
-
-    fig = px.box(
-        df_box,
-        x="category",
-        y="standardprice",
-        color="category",
-        color_discrete_map=COLOR_MAP,
-        labels={"category": "Food Category", "standardprice": "Average Price (USD)"},
-    )
-
-    fig.update_layout(
-        template="simple_white",
-        width=800,
-        height=300,
-        margin=dict(l=40, r=40, t=40, b=40),
-        showlegend=False,
-        yaxis=dict(
-            title="Average Price (USD)",
-            showgrid=True,
-            gridcolor="LightGray",
-            gridwidth=1,
-            griddash="dash",
-        ),
-    )
-    # rotate x-axis labels
-    # fig.update_xaxes(tickangle=20)
+def get_map_patch(fig, shown_traces):
+    """Patch turning a map of the same country into `fig`, a compact map figure.
+
+    Sends the market trace's positions, markers and hover data and the map
+    center; the legend traces and the rest of the layout stay. None unless
+    both maps have a market trace: a year without markets has only the two
+    legend traces.
+    """
+    if len(fig["data"]) != shown_traces or shown_traces <= 2:
+        return None
+    patch = Patch()
+    markets = fig["data"][0]
+    for key in MAP_MARKET_KEYS:
+        if key in markets:
+            patch["data"][0][key] = markets[key]
+    patch["layout"]["mapbox"]["center"] = fig["layout"]["mapbox"]["center"]
+    return patch
+
+
+def get_box_plot(backend, country, year, region=None, precomputed=True):
+    with phase("filter"):
+        if precomputed:
+            # ship only the box statistics instead of every price row
+            stats, outliers = backend.box_stats(country, year, region, BOX_MAX_OUTLIERS)
+        else:
+            df_box = backend.prices(country, year, region)
+
+    with phase("figure"):
+        if precomputed:
+            fig = go.Figure()
+            for category, row in stats.iterrows():
+                color = COLOR_MAP.get(category)
+                fig.add_trace(
+                    go.Box(
+                        x=[category],
+                        q1=[row["q1"]],
+                        median=[row["median"]],
+                        q3=[row["q3"]],
+                        lowerfence=[row["lowerfence"]],
+                        upperfence=[row["upperfence"]],
+                        name=category,
+                        marker_color=color,
+                        boxpoints=False,
+                    )
+                )
+                points = outliers[outliers["category"] == category]
+                if len(points):
+                    fig.add_trace(
+                        go.Scatter(
+                            x=points["category"],
+                            y=points["standardprice"],
+                            mode="markers",
+                            marker=dict(color=color),
+                            name=category,
+                            hovertemplate="Food Category=%{x}<br>Average Price (USD)=%{y}<extra></extra>",
+                        )
+                    )
+            fig.update_layout(boxmode="overlay", xaxis_title="Food Category")
+        else:
+            fig = px.box(
+                df_box,
+                x="category",
+                y="standardprice",
+                color="category",
+                color_discrete_map=COLOR_MAP,
+                labels={
+                    "category": "Food Category",
+                    "standardprice": "Average Price (USD)",
+                },
+            )
+
+        fig.update_layout(
+            template="simple_white",
+            width=800,
+            height=300,
+            margin=dict(l=40, r=40, t=40, b=40),
+            showlegend=False,
+            yaxis=dict(
+                title="Average Price (USD)",
+                showgrid=True,
+                gridcolor="LightGray",
+                gridwidth=1,
+                griddash="dash",
+            ),
+        )
+        # rotate x-axis labels
+        # fig.update_xaxes(tickangle=20)
 
     return fig
 
 
-def get_bar_plot(df, country, year, region=None):
-    # Filter data
-    df_bar = df[(df["country"] == country) & (df["date"].dt.year == year)]
-    if region is not None:
-        df_bar = df_bar[df_bar["admin2"] == region]
-
+def get_bar_plot(backend, country, year, region=None):
     # Group & average
-    df_bar = (
-        df_bar.groupby(["category", "commodity", "Unit"])["standardprice"]
-        .mean()
-        .reset_index()
-        .sort_values("standardprice", ascending=False)
-        .head(20)
-    )
-
-    # Round prices
-    df_bar["standardprice"] = df_bar["standardprice"].round(3)
-
-    fig = px.bar(
-        df_bar,
-        x="commodity",
-        y="standardprice",
-        color="category",
-        color_discrete_map=COLOR_MAP,
-        labels={"standardprice": "Average Price (USD)", "commodity": "Commodity"},
-        hover_data={
-            "category": True,
-            "commodity": True,
-            "Unit": True,
-        },
-    )
+    with phase("groupby"):
+        df_bar = backend.top_commodities(country, year, region, n=20)
+
+    with phase("figure"):
+        fig = px.bar(
+            df_bar,
+            x="commodity",
+            y="standardprice",
+            color="category",
+            color_discrete_map=COLOR_MAP,
+            labels={"standardprice": "Average Price (USD)", "commodity": "Commodity"},
+            hover_data={
+                "category": True,
+                "commodity": True,
+                "Unit": True,
+            },
+        )
 
-    fig.update_xaxes(categoryorder="array", categoryarray=df_bar["commodity"].tolist())
+        fig.update_xaxes(
+            categoryorder="array", categoryarray=df_bar["commodity"].tolist()
+        )
 
-    fig.update_layout(
-        template="simple_white",
-        width=800,
-        height=300,
-        yaxis=dict(
-            title="Average Price (USD)",
-            showgrid=True,
-            gridcolor="LightGray",
-            gridwidth=1,
-            griddash="dash",
-        ),
-        margin=dict(l=10, r=10, t=50, b=50),
-    )
+        fig.update_layout(
+            template="simple_white",
+            width=800,
+            height=300,
+            yaxis=dict(
+                title="Average Price (USD)",
+                showgrid=True,
+                gridcolor="LightGray",
+                gridwidth=1,
+                griddash="dash",
+            ),
+            margin=dict(l=10, r=10, t=50, b=50),
+        )
     return fig
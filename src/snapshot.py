@@ -0,0 +1,218 @@
+import os
+import json
+import shutil
+import logging
+import threading
+from collections.abc import Mapping
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, workers may build twice
+    fcntl = None
+
+from .data import DATA_PATH, SliceIndex, _row_ranges, build_commodity_country_set
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.environ.get("WFP_SNAPSHOT_DIR") or os.path.join(
+    DATA_PATH, "snapshots"
+)
+# older snapshots are kept for workers that have not reloaded yet
+KEEP_SNAPSHOTS = 2
+# part of the directory name; bump it when the files' layout changes
+SNAPSHOT_FORMAT = 2
+
+_lock = threading.Lock()
+
+
+def _write_table(df, path, preserve_index=False):
+    table = pa.Table.from_pandas(df, preserve_index=preserve_index)
+    # uncompressed, so readers can map the buffers instead of decoding them
+    with pa.OSFile(path, "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _read_table(path):
+    # buffers point into the mapped file: every worker reading the same
+    # snapshot shares one copy of the pages through the page cache
+    table = ipc.open_file(pa.memory_map(path)).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def _long(tables, key_columns):
+    """Concatenate a dict of frames keyed by tuples into one frame."""
+    frames = []
+    for key, frame in sorted(tables.items()):
+        frames.append(frame.assign(**dict(zip(key_columns, key))))
+    return pd.concat(frames, ignore_index=True)
+
+
+class _Slices(Mapping):
+    """Frames keyed by row range of a long table, built on first lookup.
+
+    A frame per key costs about 0.4 ms to construct, which for the ~1,000
+    map and price keys was most of the time to open a snapshot; a worker
+    only ever builds the ones it is asked for. The frames are views into the
+    mapped columns.
+    """
+
+    def __init__(self, df, ranges, value_columns):
+        self._columns = {c: df[c].to_numpy() for c in value_columns}
+        self._ranges = ranges
+        self._frames = {}
+
+    def __getitem__(self, key):
+        frame = self._frames.get(key)
+        if frame is None:
+            start, stop = self._ranges[key]
+            frame = pd.DataFrame(
+                {c: values[start:stop] for c, values in self._columns.items()},
+                copy=False,
+            )
+            self._frames[key] = frame
+        return frame
+
+    def __iter__(self):
+        return iter(self._ranges)
+
+    def __len__(self):
+        return len(self._ranges)
+
+
+def write_snapshot(tables, path):
+    (
+        wfp,
+        fao,
+        fao_grouped,
+        aff_index,
+        commodity_country_set,
+        wfp_index,
+        markets,
+        price_cube,
+        market_table,
+    ) = tables
+    os.makedirs(path, exist_ok=True)
+    # the SliceIndex frame, already sorted by (country, year, admin2, date)
+    _write_table(wfp_index.frame, os.path.join(path, "wfp.arrow"))
+    _write_table(markets, os.path.join(path, "markets.arrow"), preserve_index=True)
+    _write_table(fao, os.path.join(path, "fao.arrow"))
+    _write_table(fao_grouped, os.path.join(path, "fao_grouped.arrow"))
+    _write_table(aff_index, os.path.join(path, "aff_index.arrow"))
+    pairs = commodity_country_set.explode("countries")
+    _write_table(
+        pd.DataFrame(
+            {
+                "commodity": pairs["commodity"],
+                "country": pairs["countries"].astype("category"),
+            }
+        ),
+        os.path.join(path, "commodity_country.arrow"),
+    )
+    _write_table(
+        _long(price_cube, ["group", "country"]),
+        os.path.join(path, "price_cube.arrow"),
+    )
+    _write_table(
+        _long(market_table, ["country", "year"]),
+        os.path.join(path, "market_table.arrow"),
+    )
+
+
+def read_snapshot(path):
+    """The `prepare_data` tuple, backed by the snapshot's mapped files."""
+
+    def read(name):
+        return _read_table(os.path.join(path, f"{name}.arrow"))
+
+    wfp_index = SliceIndex(read("wfp"), presorted=True)
+    commodity_country_set = build_commodity_country_set(read("commodity_country"))
+
+    long = read("price_cube")
+    price_cube = _Slices(
+        long, _row_ranges(long, ["group", "country"]), ["date", "year", "sum", "count"]
+    )
+    long = read("market_table")
+    ranges = {
+        (country, int(year)): rows
+        for (country, year), rows in _row_ranges(long, ["country", "year"]).items()
+    }
+    market_table = _Slices(
+        long, ranges, ["admin2", "latitude", "longitude", "standardprice"]
+    )
+    return (
+        wfp_index.frame,
+        read("fao"),
+        read("fao_grouped"),
+        read("aff_index"),
+        commodity_country_set,
+        wfp_index,
+        read("markets"),
+        price_cube,
+        market_table,
+    )
+
+
+def _prune(root, keep):
+    snapshots = sorted(
+        (e for e in os.scandir(root) if e.is_dir() and not e.name.endswith(".tmp")),
+        key=lambda e: e.stat().st_mtime,
+        reverse=True,
+    )
+    # unlinking is safe on POSIX: workers that mapped the files keep their pages
+    for entry in snapshots[keep:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _path(name, root):
+    return os.path.join(root, f"{name}.v{SNAPSHOT_FORMAT}")
+
+
+def load_snapshot(name, build, root=SNAPSHOT_DIR):
+    """Open snapshot `name`, building it with `build()` first if it is missing.
+
+    Only one process builds a snapshot; workers starting at the same time
+    wait on a lock file and then map the finished files.
+    """
+    path = _path(name, root)
+    os.makedirs(root, exist_ok=True)
+    with _lock, open(os.path.join(root, ".lock"), "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if not os.path.isdir(path):
+                logger.info("building data snapshot %s", path)
+                tmp_path = f"{path}.tmp"
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                write_snapshot(build(), tmp_path)
+                os.replace(tmp_path, path)
+                _prune(root, KEEP_SNAPSHOTS)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return read_snapshot(path)
+
+
+def load_artifact(name, filename, build, root=SNAPSHOT_DIR):
+    """A JSON value stored with snapshot `name`, computed by `build()` once.
+
+    For derived values that are cheap to store but slow to compute, like
+    figures. Workers racing on a missing artifact each build it; the last
+    atomic rename wins.
+    """
+    path = os.path.join(_path(name, root), filename)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    value = build()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)
+    return value
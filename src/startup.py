@@ -0,0 +1,41 @@
+"""Wall time of each cold-start phase of the dashboard process.
+
+The clock starts when this module is first imported, so `src.app` imports it
+before anything heavy and calls `mark` after each phase. The phases are
+logged once the app is ready and exported on /metrics;
+`python -m benchmarks.startup` reports them over fresh processes.
+"""
+
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+STARTED = time.perf_counter()
+_last = STARTED
+
+# phase name -> seconds, in the order the phases ran
+PHASES = {}
+
+
+def mark(name):
+    """Record the time since the previous mark as phase `name`."""
+    global _last
+    now = time.perf_counter()
+    PHASES[name] = PHASES.get(name, 0.0) + now - _last
+    _last = now
+
+
+def total():
+    return _last - STARTED
+
+
+def report():
+    width = max((len(name) for name in PHASES), default=0)
+    lines = [f"{name:<{width}} {seconds:7.3f} s" for name, seconds in PHASES.items()]
+    lines.append(f"{'total':<{width}} {total():7.3f} s")
+    return "\n".join(lines)
+
+
+def done():
+    logger.info("startup phases:\n%s", report())
@@ -0,0 +1,207 @@
+import os
+import shutil
+import argparse
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# WFP rows are partitioned on disk as <root>/country=<name>/year=<yyyy>/part-0.parquet
+PARTITIONING = ds.partitioning(
+    pa.schema([("country", pa.string()), ("year", pa.int16())]), flavor="hive"
+)
+
+# ~one row group per few months of a large country; small enough that the
+# min/max statistics on `date` let readers skip most of a partition
+ROW_GROUP_SIZE = 16_384
+
+# files the writer keeps open at once, well below the usual limit of 1024
+# file descriptors. The rows arrive sorted by partition, so a file is done
+# when the writer closes it and every partition is still one part-0 file
+MAX_OPEN_FILES = 256
+
+
+# a store is <root>.versions/<nnnnnn>/ with <root> a symlink to the current
+# version; the previous one is kept for readers that resolved it just before
+# a swap, older ones are deleted
+KEEP_VERSIONS = 2
+
+
+def _versions(root):
+    directory = f"{root}.versions"
+    names = os.listdir(directory) if os.path.isdir(directory) else []
+    return directory, sorted(name for name in names if name.isdigit())
+
+
+def resolve_store(root):
+    """The directory of the store version `root` points to, or None.
+
+    Readers resolve the link once and read only that directory, so a swap
+    while they read never mixes two versions or finds the store missing.
+    """
+    if os.path.isdir(root):
+        return os.path.realpath(root)
+    # `root` is only missing while a store written before versioning is
+    # moved in as the first version
+    directory, names = _versions(root)
+    return os.path.join(directory, names[-1]) if names else None
+
+
+def _publish(root, new):
+    """Make the complete store directory `new` the current version of `root`."""
+    directory, names = _versions(root)
+    os.makedirs(directory, exist_ok=True)
+    number = int(names[-1]) + 1 if names else 0
+    if os.path.isdir(root) and not os.path.islink(root):
+        os.replace(root, os.path.join(directory, f"{number:06d}"))
+        number += 1
+    name = f"{number:06d}"
+    os.replace(new, os.path.join(directory, name))
+
+    # a symlink replaced by another is an atomic swap
+    link = f"{root}.link"
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.join(os.path.basename(directory), name), link)
+    os.replace(link, root)
+
+    for old in _versions(root)[1][:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+
+
+def _write_dataset(wfp, path):
+    df = wfp.copy()
+    df["year"] = df["date"].dt.year.astype("int16")
+    df = df.sort_values(["country", "year", "date"], kind="stable")
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # pyarrow refuses to write more than 1024 partitions unless told
+    # otherwise; ten years of ~100 countries is more
+    n_partitions = max(len(df[["country", "year"]].drop_duplicates()), 1)
+
+    shutil.rmtree(path, ignore_errors=True)
+    ds.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=PARTITIONING,
+        basename_template="part-{i}.parquet",
+        file_options=ds.ParquetFileFormat().make_write_options(
+            compression="zstd", write_statistics=True
+        ),
+        max_rows_per_group=ROW_GROUP_SIZE,
+        min_rows_per_group=min(ROW_GROUP_SIZE, 1024),
+        existing_data_behavior="overwrite_or_ignore",
+        max_partitions=n_partitions,
+        max_open_files=MAX_OPEN_FILES,
+    )
+
+
+def write_wfp_store(wfp, root):
+    """Write the WFP frame as a country/year partitioned parquet dataset.
+
+    Rows are sorted by date inside every partition and each row group carries
+    column statistics, so date predicates can skip row groups as well. The
+    store is written as a new version and swapped in whole.
+    """
+    tmp_root = f"{root}.tmp"
+    _write_dataset(wfp, tmp_root)
+    _publish(root, tmp_root)
+
+
+def write_wfp_partitions(wfp, root):
+    """Replace only the country/year partitions that have rows in `wfp`.
+
+    The new version hard-links the files of every other partition from the
+    current one, so only the rewritten partitions cost any I/O, and it is
+    swapped in whole like `write_wfp_store`.
+    """
+    current = resolve_store(root)
+    if current is None:
+        raise FileNotFoundError(f"{root} not found")
+    partial = f"{root}.partial"
+    _write_dataset(wfp, partial)
+
+    # parquet files are never changed in place, so versions can share them
+    tmp_root = f"{root}.tmp"
+    shutil.rmtree(tmp_root, ignore_errors=True)
+    shutil.copytree(current, tmp_root, copy_function=os.link)
+    written = []
+    for directory, _, files in list(os.walk(partial)):
+        if not files:
+            continue
+        relpath = os.path.relpath(directory, partial)
+        target = os.path.join(tmp_root, relpath)
+        shutil.rmtree(target, ignore_errors=True)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(directory, target)
+        written.append(os.path.join(root, relpath))
+    shutil.rmtree(partial, ignore_errors=True)
+    _publish(root, tmp_root)
+    return written
+
+
+def _filter(countries=None, years=None, start=None, end=None):
+    expr = None
+
+    def _and(e):
+        return e if expr is None else expr & e
+
+    if countries is not None:
+        expr = _and(ds.field("country").isin(list(countries)))
+    if years is not None:
+        start_year, end_year = years
+        expr = _and((ds.field("year") >= start_year) & (ds.field("year") <= end_year))
+    # date bounds are checked against row-group statistics, not partitions
+    if start is not None:
+        expr = _and(ds.field("date") >= pd.Timestamp(start))
+    if end is not None:
+        expr = _and(ds.field("date") <= pd.Timestamp(end))
+    return expr
+
+
+def read_wfp_store(
+    root, countries=None, years=None, start=None, end=None, columns=None
+):
+    """Read only the partitions (and row groups) a query needs.
+
+    `countries` is an iterable of names, `years` an inclusive (start, end)
+    pair and `start`/`end` optional date bounds. `columns` limits the columns
+    read; the partition columns `country` and `year` are only returned when
+    `columns` is None or lists them.
+    """
+    path = resolve_store(root)
+    if path is None:
+        raise FileNotFoundError(f"{root} not found")
+    dataset = ds.dataset(path, format="parquet", partitioning=PARTITIONING)
+    table = dataset.to_table(
+        columns=columns, filter=_filter(countries, years, start, end)
+    )
+    df = table.to_pandas()
+
+    # partitions come back in directory order; restore (country, date) order
+    order = [c for c in ("country", "date") if c in df.columns]
+    if order:
+        df = df.sort_values(order, kind="stable", ignore_index=True)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the partitioned WFP store from wfp_preprocessed.parquet"
+    )
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    data_path = os.path.join(base_dir, "..", "data", "processed")
+    parser.add_argument(
+        "--src", default=os.path.join(data_path, "wfp_preprocessed.parquet")
+    )
+    parser.add_argument("--dst", default=os.path.join(data_path, "wfp_store"))
+    args = parser.parse_args()
+
+    wfp = pd.read_parquet(args.src)
+    write_wfp_store(wfp, args.dst)
+    print(f"Wrote {len(wfp)} rows to {args.dst}")
+
+
+if __name__ == "__main__":
+    main()
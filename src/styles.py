@@ -47,6 +47,15 @@ affo_country_style = {
 
 bar_box_style = {"border": "0", "width": "100%", "height": "300px"}
 
+country_card_style = {
+    "margin-bottom": "20px",
+    "border": "0",
+    "border-radius": "10px",
+    "height": "200px",
+    "width": "100%",
+    "box-shadow": "3px 3px 15px rgba(0, 0, 0, 0.2)",
+}
+
 tooltip_style = {
     "color": "white",
     "background-color": "#777", 
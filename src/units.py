@@ -0,0 +1,157 @@
+"""Unit standardization for WFP prices (feature engineering, notebook 3).
+
+Every distinct `unit` string is parsed once into a quantity, a standard unit
+label and the multiplier from its price to the standardized price, by the
+notebook's price rules; labels are matched on the exact unit name instead of
+the notebook's overlapping substrings. The conversion is then a single vectorized
+multiplication over all rows, so the cost grows with the number of distinct
+units rather than with the number of unit rules.
+"""
+
+import re
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+# price conversions of notebook 3, matched on the exact unit name:
+# name -> (multiplier, whether the price is also divided by the quantity).
+# The notebook ignores the quantity of "Pound" and leaves names missing here
+# (Dozen, piece, Tin(20 L), ...) at their reported price; the processed data
+# is built that way, so these quirks are kept
+PRICE_CONVERSIONS = {
+    "KG": (1.0, True),
+    "G": (1000.0, True),
+    "L": (1.0, True),
+    "ML": (1000.0, True),
+    "Pounds": (2.20462, True),
+    "Pound": (2.20462, False),
+    "pcs": (1.0, True),
+    "MT": (1 / 1000, True),
+    "Tin (20 L)": (1 / 20, True),
+    "Gallon": (0.264172, True),
+    "Tubers": (1.0, True),
+    "Dozens": (1.0, True),
+}
+
+# standard unit label of every unit name the notebook labels, matched on the
+# exact name; other names ("Loaf", "Bunch", "Unit", ...) are their own label
+UNIT_LABELS = {
+    "KG": "1 KG",
+    "G": "1 KG",
+    "MT": "1 KG",
+    "Pound": "1 KG",
+    "Pounds": "1 KG",
+    "L": "1 L",
+    "ML": "1 L",
+    "Gallon": "1 L",
+    "Tin (20 L)": "1 L",
+    "Tin(20 L)": "1 L",
+    "pcs": "1 piece",
+    "piece": "1 piece",
+    "Tubers": "1 Tuber",
+    "Dozen": "1 Dozen",
+    "Dozens": "1 Dozen",
+}
+
+# the notebook's own labelling, for comparing against it only: substrings of
+# the full unit string, tried in this order with the last match winning. They
+# overlap ("G" is in "KG", "L" in "Loaf" and "Large")
+NOTEBOOK_UNIT_LABELS = [
+    ("KG", "1 KG"),
+    ("G", "1 KG"),
+    ("L", "1 L"),
+    ("ML", "1 L"),
+    ("Pounds", "1 KG"),
+    ("Pound", "1 KG"),
+    ("MT", "1 KG"),
+    ("pcs", "1 piece"),
+    ("Tin(20 L)", "1 L"),
+    ("Gallon", "1 L"),
+    ("piece", "1 piece"),
+    ("Tubers", "1 Tuber"),
+    ("Dozen", "1 Dozen"),
+    ("Dozens", "1 Dozen"),
+]
+
+# eggs reported per piece (or an unnamed "Unit") are labelled "1 Dozen". As in
+# notebook 3, whose x12 ran after the relabel and so never matched a row, the
+# price itself stays per piece
+PER_DOZEN_COMMODITY = "Eggs"
+PER_DOZEN_UNITS = ("1 piece", "Unit")
+
+_QUANTITY = re.compile(r"^(\d*\.?\d+)")
+_NAME = re.compile(r"^[\d\.]*\s*(.*)")
+
+
+class ParsedUnit(NamedTuple):
+    quantity: float
+    base: str
+    multiplier: float
+
+
+def parse_unit(unit, notebook_labels=False):
+    """Split a unit such as "500 G" into ParsedUnit(500.0, "1 KG", 2.0).
+
+    `multiplier` turns a price per `unit` into the standardized price; it is
+    1.0 for units the notebook does not convert. The label comes from
+    UNIT_LABELS, or from the notebook's substring rules with
+    `notebook_labels`.
+    """
+    if not isinstance(unit, str):
+        return ParsedUnit(1.0, None, 1.0)
+    match = _QUANTITY.match(unit)
+    quantity = float(match.group(1)) if match else 1.0
+    name = _NAME.match(unit).group(1)
+    base = UNIT_LABELS.get(name, name)
+    if notebook_labels:
+        base = name
+        for pattern, label in NOTEBOOK_UNIT_LABELS:
+            if pattern in unit:
+                base = label
+    scale, per_quantity = PRICE_CONVERSIONS.get(name, (1.0, False))
+    return ParsedUnit(quantity, base, scale / quantity if per_quantity else scale)
+
+
+def standardize_units(
+    df,
+    unit="unit",
+    price="usdprice",
+    commodity="commodity",
+    notebook_labels=False,
+):
+    """Add Value, Unit and standardprice (price per standard unit) columns.
+
+    `df` is modified in place and returned. `notebook_labels` reproduces
+    the notebook's overlapping unit labels, see `parse_unit`.
+    """
+    codes, uniques = pd.factorize(df[unit], use_na_sentinel=True)
+    parsed = [parse_unit(u, notebook_labels) for u in uniques]
+    parsed.append(parse_unit(None))  # code -1: NaN
+
+    quantity = np.array([p.quantity for p in parsed])
+    multiplier = np.array([p.multiplier for p in parsed])
+    labels, label_codes = np.unique(
+        [p.base if p.base is not None else "" for p in parsed], return_inverse=True
+    )
+
+    row_labels = label_codes[codes]
+    standardprice = df[price].to_numpy(dtype="float64") * multiplier[codes]
+
+    if commodity in df.columns:
+        # one substring test per distinct commodity, not per row
+        commodity_codes, commodities = pd.factorize(df[commodity])
+        is_eggs = np.append(
+            [PER_DOZEN_COMMODITY in str(c) for c in commodities], False
+        )[commodity_codes]
+        per_piece = np.isin(labels, PER_DOZEN_UNITS)[row_labels]
+        eggs = is_eggs & per_piece
+        if eggs.any():
+            labels = np.append(labels, "1 Dozen")
+            row_labels = np.where(eggs, len(labels) - 1, row_labels)
+
+    names = pd.Series(labels).replace("", np.nan).to_numpy()
+    df["Value"] = quantity[codes]
+    df["Unit"] = names[row_labels]
+    df["standardprice"] = standardprice
+    return df